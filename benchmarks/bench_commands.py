@@ -0,0 +1,300 @@
+'''drives the bot's commands (!coin, !market, !compare, !txns, !export) and get_stats end to end,
+against a local fake coingecko + chart server and mongomock or a throwaway mongod, for synthetic users
+with 10 to 100k txns. reports throughput and latency percentiles per command and history size.
+
+run from the repo root with the bot's requirements installed:
+    python benchmarks/bench_commands.py                       # mongomock (pip install mongomock)
+    python benchmarks/bench_commands.py --mongo mongodb://localhost:27017
+    python benchmarks/bench_commands.py --save bench.json     # keep a baseline
+    python benchmarks/bench_commands.py --baseline bench.json # exit 1 if a p50 got slower than --tolerance
+
+--mongo points at a THROWAWAY server: the bot's databases on it are dropped first.
+mongomock runs queries in python on one thread with no indexes, so every find scans all seeded txns:
+compare mongomock numbers with mongomock numbers only, and use a mongod for full !txns/!export of 100k
+(on mongomock, --skip "txns,export,txns page" for that size)'''
+import argparse
+import asyncio
+import datetime as dt
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import pymongo
+from aiohttp import web
+from discord.ext import commands
+from coingecko import TokenBucket
+
+PNG = b'\x89PNG\r\n\x1a\n'+bytes(20*1024) #about the size of a real chart
+DAY_MS = 86400*1000
+DATABASES = ('txns', 'coin_latest', 'coinref', 'market_chart', 'watchers', 'blocked')
+
+# fake services
+def coin_list(ncoins: int) -> list:
+    return [{'id':f'coin-{i}', 'symbol':f'c{i}', 'name':f'Coin {i}'} for i in range(ncoins)]
+
+def fake_app(coins: list, latency: float) -> web.Application:
+    '''coingecko's /coins/list, /coins/markets, /coins/{id}, /coins/{id}/market_chart and the chart server's POST /chart.
+    every response waits `latency` seconds first, like a network round trip'''
+    known = {c.get('id') for c in coins}
+    rng = random.Random(7)
+    price = {c.get('id'):rng.uniform(0.01, 50000) for c in coins}
+
+    async def pause():
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def coins_list(request):
+        await pause()
+        return web.json_response(coins)
+
+    async def markets(request):
+        await pause()
+        ids = [i for i in request.query.get('ids', '').split(',') if i in known]
+        return web.json_response([{'id':i, 'current_price':price[i], 'market_cap':price[i]*1e6,
+            'price_change_percentage_24h':rng.uniform(-10, 10)} for i in ids])
+
+    async def coin(request):
+        await pause()
+        if request.match_info['id'] not in known:
+            return web.json_response({'error':'coin not found'}, status=404)
+        return web.json_response({'id':request.match_info['id']})
+
+    async def market_chart(request):
+        await pause()
+        cid = request.match_info['id']
+        if cid not in known:
+            return web.json_response({'error':'coin not found'}, status=404)
+        days = request.query.get('days')
+        daily = request.query.get('interval') == 'daily'
+        span = 2000 if days == 'max' else int(days)
+        step = DAY_MS if daily else DAY_MS//24
+        today = int(time.time()*1000)//DAY_MS*DAY_MS if daily else int(time.time()*1000)
+        n = span*DAY_MS//step
+        return web.json_response({'prices':[[today-(n-k)*step, price[cid]*(1+0.001*k)] for k in range(n+1)]})
+
+    async def chart(request):
+        await request.read()
+        await pause()
+        return web.Response(body=PNG, content_type='image/png')
+
+    app = web.Application()
+    app.router.add_get('/api/v3/coins/list', coins_list)
+    app.router.add_get('/api/v3/coins/markets', markets)
+    app.router.add_get('/api/v3/coins/{id}/market_chart', market_chart)
+    app.router.add_get('/api/v3/coins/{id}', coin)
+    app.router.add_post('/chart', chart)
+    return app
+
+async def serve(app: web.Application) -> tuple:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, runner.addresses[0][1]
+
+# the bot
+def load_bot(mongo: str):
+    '''import discoin-mongo.py without connecting to discord: Bot.run is a no-op while it loads,
+    and the Scheduler's loops are cancelled before they first run (the benchmark refreshes by hand)'''
+    if mongo == 'mongomock':
+        import mongomock
+        pymongo.MongoClient = mongomock.MongoClient #the bot does `from pymongo import MongoClient`
+    else:
+        os.environ['mongodb_url'] = mongo
+    spec = importlib.util.spec_from_file_location('discoin', os.path.join(ROOT, 'discoin-mongo.py'))
+    bot = importlib.util.module_from_spec(spec)
+    run, commands.Bot.run = commands.Bot.run, lambda self, *args, **kwargs: None
+    try:
+        spec.loader.exec_module(bot)
+    finally:
+        commands.Bot.run = run
+    sched = bot.bot.get_cog('Scheduler')
+    for loop in (sched.cleanup, sched.refresh_coinlist, sched.update_coinvals):
+        loop.cancel()
+    if mongo == 'mongomock':
+        bot.store.pool = ThreadPoolExecutor(max_workers=1) #mongomock isn't thread safe, e.g. it edits projections in place
+    return bot
+
+class Sink:
+    '''stands in for a discord user/channel; counts what would have been sent'''
+    def __init__(self):
+        self.messages = 0
+        self.files = 0
+
+    async def send(self, *args, **kwargs):
+        self.messages += 1
+        if kwargs.get('file') is not None:
+            self.files += 1
+
+    async def add_reaction(self, emoji):
+        pass
+
+def fake_ctx(userid: int, sink: Sink):
+    author = SimpleNamespace(id=userid, name=f'bench{userid}', display_name=f'bench{userid}',
+        discriminator='0000', send=sink.send)
+    message = SimpleNamespace(add_reaction=sink.add_reaction, guild=None, content='')
+    return SimpleNamespace(author=author, channel=sink, message=message, send=sink.send)
+
+def synthetic_txns(userid: str, n: int, coins: list, seed: int) -> list:
+    '''n txns over `coins`, roughly 1 in 5 a sale'''
+    rng = random.Random(seed)
+    start = dt.date(2019, 1, 1)
+    out = []
+    for i in range(n):
+        amount = rng.uniform(0.01, 10)
+        price = amount*rng.uniform(1, 1000)
+        if rng.random() < 0.2:
+            amount, price = -amount/4, -price/4
+        out.append({'userid':userid, 'currency':coins[i % len(coins)], 'amount':amount, 'price':price,
+            'date':(start+dt.timedelta(days=rng.randrange(1500))).isoformat()})
+    return out
+
+async def seed(bot, sizes: list, coins: list, held: int, indexes: bool):
+    def _seed():
+        for db in DATABASES:
+            bot.client.drop_database(db)
+        for size in sizes:
+            txns = synthetic_txns(str(size), size, coins[:held], seed=size)
+            for i in range(0, len(txns), 10000):
+                bot.store.txns.insert_many(txns[i:i+10000])
+    await bot.store.run(_seed)
+    if indexes: #mongomock has no use for them
+        await bot.store.ensure_indexes()
+    await bot.store.rebuild_positions()
+    sched = bot.bot.get_cog('Scheduler')
+    await sched._refresh_coinlist()
+    await sched._update_coinvals()
+
+# measuring
+def percentile(ordered: list, q: float) -> float:
+    return ordered[min(int(q*len(ordered)), len(ordered)-1)]
+
+async def measure(fn, iterations: int, concurrency: int) -> dict:
+    '''runs `fn()` `iterations` times, at most `concurrency` at once'''
+    sem = asyncio.Semaphore(concurrency)
+    times = []
+    async def one():
+        async with sem:
+            t = time.perf_counter()
+            await fn()
+            times.append(time.perf_counter()-t)
+    start = time.perf_counter()
+    await asyncio.gather(*[one() for _ in range(iterations)])
+    wall = time.perf_counter()-start
+    times.sort()
+    return {'calls':iterations, 'ops':iterations/wall, 'p50':percentile(times, 0.5)*1000,
+        'p95':percentile(times, 0.95)*1000, 'p99':percentile(times, 0.99)*1000, 'max':times[-1]*1000}
+
+def scenarios(bot, userid: int, sink: Sink, coins: list) -> dict:
+    '''name -> zero-arg coroutine function, one per hot path'''
+    ctx = fake_ctx(userid, sink)
+    rng = random.Random(userid)
+    positions = {}
+
+    async def coin():
+        await bot._coin.callback(ctx)
+
+    async def market():
+        await bot._market.callback(ctx, rng.choice(coins), '90')
+
+    async def compare():
+        await bot._compare.callback(ctx, rng.choice(coins), rng.choice(coins), '90')
+
+    async def txns_page():
+        await bot._txns.callback(ctx, 'page', '3')
+
+    async def txns_all():
+        await bot._txns.callback(ctx)
+
+    async def export():
+        await bot._export.callback(ctx, 'csv')
+
+    async def stats():
+        if not positions:
+            positions.update(await bot.store.user_positions(str(userid)))
+        bot.get_stats(positions)
+
+    return {'coin':coin, 'market':market, 'compare':compare, 'txns page':txns_page,
+        'txns':txns_all, 'export':export, 'get_stats':stats}
+
+def compare_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    '''(key, old p50, new p50) for everything whose p50 got more than `tolerance` slower'''
+    slower = []
+    for key,r in results.items():
+        old = baseline.get(key)
+        if old and r.get('p50') > old.get('p50')*(1+tolerance):
+            slower.append((key, old.get('p50'), r.get('p50')))
+    return slower
+
+async def main(args) -> int:
+    coins = coin_list(args.coins)
+    runner, port = await serve(fake_app(coins, args.latency/1000))
+    bot = load_bot(args.mongo)
+    logging.getLogger().setLevel(logging.WARNING) #the bot logs json lines at INFO
+    bot.cg.base = f'http://127.0.0.1:{port}/api/v3'
+    bot.cg.bucket = TokenBucket(rate=10**9, per=1) #measure the bot, not coingecko's rate limit
+    bot.quickchart.url = f'http://127.0.0.1:{port}/chart'
+    held = [c.get('id') for c in coins[:args.held]]
+    await seed(bot, args.sizes, [c.get('id') for c in coins], args.held, indexes=args.mongo != 'mongomock')
+
+    results = {}
+    print(f'{"command":<10} {"txns":>7} {"calls":>6} {"ops/s":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>8}')
+    for size in args.sizes:
+        sink = Sink()
+        for name,fn in scenarios(bot, size, sink, held).items():
+            if name in args.skip:
+                continue
+            # a full !txns or export of 100k txns takes seconds, so fewer rounds for those
+            iterations = max(args.iterations*min(1000/size, 1), 3) if name in ('txns', 'export') else args.iterations
+            r = await measure(fn, int(iterations), args.concurrency)
+            results[f'{name}/{size}'] = r
+            print(f'{name:<10} {size:>7} {r["calls"]:>6} {r["ops"]:>8.1f} {r["p50"]:>8.2f} {r["p95"]:>8.2f} {r["p99"]:>8.2f} {r["max"]:>8.2f}')
+    print(f'chart cache: {bot.quickchart.cache.stats()}')
+
+    await bot.cg.close()
+    await bot.quickchart.close()
+    await runner.cleanup()
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare_baseline(results, json.load(f), args.tolerance)
+        for key, old, new in slower:
+            print(f'REGRESSION {key}: p50 {old:.2f}ms -> {new:.2f}ms')
+        return 1 if slower else 0
+    return 0
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    p.add_argument('--mongo', default='mongomock', help='mongomock, or the url of a throwaway mongod')
+    p.add_argument('--sizes', default='10,1000,100000', type=lambda s: [int(x) for x in s.split(',')],
+        help='txns per synthetic user')
+    p.add_argument('--coins', default=2000, type=int, help='coins in the fake /coins/list')
+    p.add_argument('--held', default=50, type=int, help='distinct coins each user trades')
+    p.add_argument('--iterations', default=50, type=int, help='calls per command and user')
+    p.add_argument('--concurrency', default=4, type=int, help='calls in flight at once')
+    p.add_argument('--latency', default=0, type=float, help='ms the fake services wait before answering')
+    p.add_argument('--skip', default='', type=lambda s: set(s.split(',')), help='commands to leave out, e.g. txns,export')
+    p.add_argument('--save', help='write results as json')
+    p.add_argument('--baseline', help='results json from an earlier run to compare against')
+    p.add_argument('--tolerance', default=0.25, type=float, help='allowed p50 slowdown against --baseline')
+    return p.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.save:
+        args.save = os.path.abspath(args.save)
+    if args.baseline:
+        args.baseline = os.path.abspath(args.baseline)
+    os.chdir(tempfile.mkdtemp(prefix='discoin-bench-')) #slow-command dumps and anything else the bot writes to cwd
+    sys.exit(asyncio.get_event_loop().run_until_complete(main(args)))
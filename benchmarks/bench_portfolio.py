@@ -0,0 +1,82 @@
+'''times portfolio.positions/stats against the old per-coin filter loop from get_stats.
+run from the repo root: python benchmarks/bench_portfolio.py'''
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+import portfolio
+
+def synthetic_orders(n: int, ncoins: int=50, seed: int=1) -> list:
+    '''n orders over ncoins coins, roughly 1 in 5 a sale'''
+    rng = random.Random(seed)
+    coins = [f'coin-{i}' for i in range(ncoins)]
+    orders = []
+    for i in range(n):
+        amount = rng.uniform(0.01, 10)
+        price = amount*rng.uniform(1, 1000)
+        if rng.random() < 0.2:
+            amount, price = -amount/4, -price/4
+        orders.append({'currency': coins[i % ncoins], 'amount': amount, 'price': price,
+            'date': '2022-01-01', 'userid': '1'})
+    return orders, {c: {'usd': rng.uniform(1, 1000)} for c in coins}
+
+def legacy_stats(orders: list, coinval: dict) -> dict:
+    '''get_stats as it was before the single-pass engine'''
+    coins = set(x.get('currency') for x in orders)
+    coinStats = []
+    for coin in coins:
+        txns = list(filter(lambda x:x.get('currency')==coin, orders))
+        buys = [x for x in txns if x.get('price') >= 0]
+        sales = [x for x in txns if x.get('price') < 0]
+        buyAvg = sum([x.get('price') for x in buys])/sum([x.get('amount') for x in buys])
+        if not sales:
+            saleAvg = 0
+        else:
+            saleAvg = sum([x.get('price') for x in sales])/sum([x.get('amount') for x in sales])
+        d = {
+            'coin': coin,
+            'coinUSD': coinval.get(coin).get('usd'),
+            'coinOwned': sum([x.get('amount') for x in txns]),
+            'usdSpent': sum([x.get('price') for x in buys]),
+            'avgPurchasePrice': buyAvg,
+            'usdProfit': -1*sum([x.get('price') for x in sales]),
+            'avgProfitPrice': saleAvg,
+        }
+        d['coinValue'] = d.get('coinOwned')*d.get('coinUSD')
+        d['gainLoss'] = (d.get('coinUSD') - buyAvg)/buyAvg*100 if d.get('coinValue') > 0 else 0
+        coinStats.append(d)
+    totalSpent = sum(c.get('usdSpent') for c in coinStats)
+    totalValue = sum(c.get('coinValue') for c in coinStats)
+    totalProfit = sum(c.get('usdProfit') for c in coinStats)
+    return {'summary': {'totalValue': totalValue, 'totalSpent': totalSpent, 'totalGain': totalValue-totalSpent,
+        'totalProfit': totalProfit, 'roi': (totalValue-(totalSpent-totalProfit))/(totalSpent-totalProfit),
+        'invested': totalSpent-totalProfit}, 'coinStats': coinStats}
+
+def close(a: dict, b: dict) -> bool:
+    return all(abs(a[k]-b[k]) <= 1e-6*max(1, abs(a[k])) for k in a if isinstance(a[k], float))
+
+def timed(fn, *args, repeat: int=3) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter()-t)
+    return best
+
+def main(sizes=(1000, 10000, 100000)):
+    print(f'{"orders":>8} {"legacy ms":>10} {"engine ms":>10} {"speedup":>8}')
+    for n in sizes:
+        orders, coinval = synthetic_orders(n)
+        old = legacy_stats(orders, coinval)
+        new = portfolio.stats(portfolio.positions(orders), coinval)
+        assert close(old.get('summary'), new.get('summary'))
+        byCoin = {c.get('coin'):c for c in old.get('coinStats')}
+        assert all(close(byCoin[c.get('coin')], c) for c in new.get('coinStats'))
+        legacy = timed(legacy_stats, orders, coinval)
+        engine = timed(lambda o, v: portfolio.stats(portfolio.positions(o), v), orders, coinval)
+        print(f'{n:>8} {legacy*1000:>10.1f} {engine*1000:>10.1f} {legacy/engine:>7.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''renders charts on the quickchart server into memory, one buffer per request'''
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import time
+from collections import OrderedDict
+import aiohttp
+import metrics
+import profiling
+
+log = logging.getLogger(__name__)
+
+CHART_URL = 'http://192.168.1.207:8888/chart'
+
+def chart_key(post_data: dict) -> str:
+    '''stable hash of a chart spec, independent of dict ordering'''
+    raw = json.dumps(post_data, sort_keys=True, separators=(',',':'), default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class ChartCache:
+    '''LRU of rendered png bytes, bounded by total bytes and expiring after `ttl` seconds.
+    ttl defaults to the 5 minute price refresh window'''
+    def __init__(self, max_bytes=32*1024*1024, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (expires, bytes)
+
+    def get(self, key: str) -> bytes:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (time.monotonic()+self.ttl, content)
+        self.size += len(content)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    def _drop(self, key: str):
+        self.size -= len(self._entries.pop(key)[1])
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'entries': len(self._entries), 'bytes': self.size, 'hits': self.hits,
+            'misses': self.misses, 'hitRatio': self.hits/total if total else 0}
+
+class QuickChart:
+    def __init__(self, url=CHART_URL, timeout=15, cache=None):
+        self.url = url
+        self.cache = cache if cache is not None else ChartCache()
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session = None
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        return self._session
+
+    async def render(self, post_data: dict) -> io.BytesIO:
+        '''returns the png in a BytesIO, or None if the chart server fails.
+        identical specs are served from the cache without hitting the chart server'''
+        key = chart_key(post_data)
+        content = self.cache.get(key)
+        metrics.cache('chart', content is not None)
+        if content is not None:
+            return io.BytesIO(content)
+        try:
+            with metrics.UPSTREAM.time('quickchart', 'render'), profiling.span('quickchart render'):
+                async with self.session().post(self.url, json=post_data) as r:
+                    if r.status != 200:
+                        metrics.UPSTREAM_ERRORS.inc('quickchart', 'render')
+                        log.warning('chart creation failed', extra={'status':r.status})
+                        return None
+                    content = await r.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            metrics.UPSTREAM_ERRORS.inc('quickchart', 'render')
+            log.warning('chart creation failed', extra={'error':repr(e)})
+            return None
+        log.debug('chart created', extra={'bytes':len(content)})
+        self.cache.put(key, content)
+        return io.BytesIO(content)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,177 @@
+'''async coingecko client shared by every command and the Scheduler'''
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+import aiohttp
+import metrics
+import profiling
+
+log = logging.getLogger(__name__)
+
+BASE = 'https://api.coingecko.com/api/v3'
+MARKETS_PAGE = 250 #most ids /coins/markets returns per call
+MAX_IDS_LEN = 3000 #keeps the ids param well under url length limits
+
+class CoinGeckoError(Exception):
+    def __init__(self, status, url, body=None):
+        self.status = status
+        self.url = url
+        self.body = body
+        super().__init__(f'coingecko returned {status} for {url}')
+
+def retry_after(header, default: float) -> float:
+    '''seconds to wait from a Retry-After header, which is either seconds or an http date'''
+    if not header:
+        return default
+    try:
+        return max(float(header), 0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(header).timestamp() - time.time()), 0)
+    except (TypeError, ValueError):
+        return default
+
+def id_chunks(ids: list, n: int=MARKETS_PAGE, maxlen: int=MAX_IDS_LEN):
+    '''split coin ids into chunks of at most `n` ids and `maxlen` characters once joined'''
+    chunk, size = [], 0
+    for i in ids:
+        if chunk and (len(chunk) == n or size+len(i)+1 > maxlen):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(i)
+        size += len(i)+1
+    if chunk:
+        yield chunk
+
+def endpoint(path: str) -> str:
+    '''metric label for a path, with the coin id swapped out: /coins/bitcoin/market_chart -> /coins/{id}/market_chart'''
+    parts = path.split('/')
+    if len(parts) > 2 and parts[1] == 'coins' and parts[2] not in ('markets', 'list'):
+        parts[2] = '{id}'
+    return '/'.join(parts)
+
+class TokenBucket:
+    '''allows `rate` calls per `per` seconds with bursts up to `burst`.
+    pause() stops everyone, e.g. after a 429'''
+    def __init__(self, rate=25, per=60, burst=None):
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.fill = rate/per
+        self.stamp = time.monotonic()
+        self.until = 0
+
+    def pause(self, seconds: float):
+        self.until = max(self.until, time.monotonic()+seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.until:
+                await asyncio.sleep(self.until-now)
+                continue
+            self.tokens = min(self.capacity, self.tokens + (now-self.stamp)*self.fill)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1-self.tokens)/self.fill)
+
+class CoinGecko:
+    '''one pooled keep-alive session; requests are capped by `limit` and time out after `timeout` seconds.
+    every call goes through a shared token bucket, identical in-flight calls share one response,
+    and 429s are retried with backoff'''
+    def __init__(self, base=BASE, timeout=10, limit=8, rate=25, per=60, retries=3, backoff=2):
+        self.base = base
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.limit = limit
+        self.bucket = TokenBucket(rate=rate, per=per)
+        self.retries = retries
+        self.backoff = backoff
+        self._session = None
+        self._sem = None
+        self._inflight = {}
+
+    def session(self) -> aiohttp.ClientSession:
+        # created lazily so the session and semaphore bind to the bot's running loop
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, keepalive_timeout=60, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sem = asyncio.Semaphore(self.limit)
+        return self._session
+
+    async def request(self, path: str, params: dict=None):
+        '''returns (status, json) for a GET on `path`; json is None if the body isn't json.
+        status is None if coingecko couldn't be reached or timed out.
+        callers asking for the same url while it's in flight get the same result'''
+        # aiohttp only takes str params
+        params = {k:str(v) for k,v in (params or {}).items()}
+        key = (path, tuple(sorted(params.items())))
+        task = self._inflight.get(key)
+        metrics.cache('coingecko_inflight', task is not None)
+        if task is None:
+            task = asyncio.ensure_future(self._request(path, params))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield so one caller being cancelled doesn't cancel the shared request
+        with profiling.span('coingecko '+endpoint(path)):
+            return await asyncio.shield(task)
+
+    async def _request(self, path: str, params: dict):
+        session = self.session()
+        op = endpoint(path)
+        for attempt in range(self.retries+1):
+            await self.bucket.acquire()
+            async with self._sem:
+                start = time.perf_counter()
+                try:
+                    async with session.get(self.base+path, params=params) as r:
+                        try:
+                            data = await r.json(content_type=None)
+                        except ValueError:
+                            data = None
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    # callers only handle statuses and CoinGeckoError, so a dropped connection or timeout is status None
+                    metrics.UPSTREAM_ERRORS.inc('coingecko', op)
+                    log.warning('coingecko unreachable', extra={'path':op, 'error':repr(e)})
+                    return None, None
+                except Exception:
+                    metrics.UPSTREAM_ERRORS.inc('coingecko', op)
+                    raise
+                finally:
+                    metrics.UPSTREAM.observe(time.perf_counter()-start, 'coingecko', op)
+                log.debug('coingecko', extra={'url':str(r.url), 'status':r.status})
+                if r.status != 200:
+                    metrics.UPSTREAM_ERRORS.inc('coingecko', op)
+                if r.status != 429 or attempt == self.retries:
+                    return r.status, data
+                wait = retry_after(r.headers.get('Retry-After'), self.backoff*2**attempt)
+            log.warning('coingecko 429, retrying', extra={'wait':wait, 'path':op})
+            self.bucket.pause(wait)
+
+    async def get(self, path: str, params: dict=None):
+        '''like request() but raises CoinGeckoError on anything but a 200'''
+        status, data = await self.request(path, params)
+        if status != 200:
+            raise CoinGeckoError(status, self.base+path, data)
+        return data
+
+    async def markets(self, ids, vs_currency: str='usd') -> dict:
+        '''/coins/markets (price, 24h change, market cap...) for any number of ids,
+        one request per 250 ids. returns {id: market row}; ids in a failed chunk are left out'''
+        async def page(chunk):
+            p = {'ids':','.join(chunk), 'vs_currency':vs_currency, 'order':'market_cap_desc',
+                'per_page':MARKETS_PAGE, 'page':1, 'price_change_percentage':'24h'}
+            status, rows = await self.request('/coins/markets', params=p)
+            if status != 200:
+                log.warning('coins/markets failed', extra={'ids':len(chunk), 'status':status})
+                return []
+            return rows
+        pages = await asyncio.gather(*[page(c) for c in id_chunks(list(ids))])
+        return {r.get('id'):r for rows in pages for r in rows}
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
@@ -0,0 +1,80 @@
+'''in-memory lookups over the coingecko coin list (~15k coins), rebuilt with each refresh_coinlist'''
+from bisect import bisect_left
+from collections import Counter
+
+def trigrams(s: str) -> set:
+    s = f' {s.lower()} '
+    return set(s[i:i+3] for i in range(len(s)-2))
+
+class CoinIndex:
+    '''exact id/symbol/name maps, sorted keys for prefix search, and a trigram index for fuzzy matches'''
+    def __init__(self, coins: list=()):
+        # (coins, exact maps, sorted (key, field, position in coins), trigram postings)
+        self.state = ([], {'id':{}, 'symbol':{}, 'name':{}}, [], {})
+        self.build(coins)
+
+    def __len__(self):
+        return len(self.state[0])
+
+    def build(self, coins: list):
+        '''index a fresh coin list. safe to run on a worker thread:
+        the new maps are swapped in as one tuple so lookups never see a half-built index'''
+        coins = [{'id':c.get('id'), 'symbol':c.get('symbol'), 'name':c.get('name')} for c in coins]
+        exact = {'id':{}, 'symbol':{}, 'name':{}}
+        prefix = []
+        grams = {}
+        for n,c in enumerate(coins):
+            for field in ('id', 'symbol', 'name'):
+                key = (c.get(field) or '').lower()
+                if not key:
+                    continue
+                exact[field].setdefault(key, []).append(n)
+                prefix.append((key, field, n))
+                for g in trigrams(key):
+                    grams.setdefault(g, set()).add(n)
+        prefix.sort()
+        self.state = (coins, exact, prefix, grams)
+
+    def get(self, value: str, key: str='id') -> dict:
+        '''exact lookup like coinref.find_one({key: value}), None if missing'''
+        coins, exact, _, _ = self.state
+        hits = exact.get(key, {}).get((value or '').lower())
+        return dict(coins[hits[0]]) if hits else None
+
+    def search(self, keyword: str, limit: int=25) -> list:
+        '''ranked matches: exact symbol, exact id/name, symbol prefix, id/name prefix, then trigram similarity'''
+        kw = (keyword or '').lower().strip()
+        if not kw:
+            return []
+        coins, exact, prefix, grams = self.state
+        ranks = {}
+        def rank(n, r):
+            if r < ranks.get(n, float('inf')):
+                ranks[n] = r
+        for n in exact.get('symbol').get(kw, []):
+            rank(n, 0)
+        for field in ('id', 'name'):
+            for n in exact.get(field).get(kw, []):
+                rank(n, 1)
+        i = bisect_left(prefix, (kw,))
+        while i < len(prefix) and prefix[i][0].startswith(kw):
+            key, field, n = prefix[i]
+            rank(n, 2 if field == 'symbol' else 3)
+            i += 1
+        if len(ranks) < limit:
+            q = trigrams(kw)
+            overlap = Counter()
+            common = max(len(coins)//20, 50)
+            for g in q:
+                posting = grams.get(g, ())
+                if len(posting) > common: # grams like 'oin' match thousands of coins and rank nothing
+                    continue
+                for n in posting:
+                    overlap[n] += 1
+            for n,shared in overlap.most_common(limit*4):
+                score = shared/len(q)
+                if score < 0.4:
+                    break
+                rank(n, 5-score) # 4..4.6, better overlap first
+        best = sorted(ranks.items(), key=lambda x:(x[1], len(coins[x[0]].get('id'))))
+        return [dict(coins[n]) for n,_ in best[:limit]]
@@ -1,236 +1,275 @@
-from logging import error, INFO
+import logging
 from os import getenv, listdir, remove
-import requests
+import asyncio
 import datetime as dt
-import json
 from pymongo import MongoClient
-from bson import ObjectId
+from coingecko import CoinGecko, CoinGeckoError
+from store import Store
+from charts import QuickChart
+from marketdata import MarketSeries
+from prices import PriceCache, from_market
+import portfolio
+import exports
+import imports
+import tax
+from watchers import Watchers
+from scheduling import Activity, Job, price_interval
+from coinindex import CoinIndex
+import metrics
+import profiling
 
 from discord import Embed, Color, File, Member
 from discord.ext import commands, tasks
 from discord.ext.commands.errors import CommandError
 
 # Non-command functions
+metrics.setup_logging()
+log = logging.getLogger('discoin')
 mongourl = getenv('mongodb_url')
 client = MongoClient(mongourl)
-
-def chunker(lst, n):
-    """Yield successive `n`-sized chunks from list `lst` of known length."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i+n]
-
-def search_coins(keyword):
-    db = client.coinref
-    return [x for x in db.coinref.find({'$text':{'$search':keyword}},{'_id':0})]
-
-def dbck(coin, key='id') -> dict:
-    db = client.coinref
-    r = [x for x in db.coinref.find({key:coin})]
+cg = CoinGecko()
+store = Store(client)
+quickchart = QuickChart()
+market_series = MarketSeries(store, cg)
+prices = PriceCache()
+coin_index = CoinIndex() #filled by refresh_coinlist
+tax_cache = tax.TaxCache()
+store.on_write.append(tax_cache.invalidate)
+tax_inflight = {} #(userid, method) -> task computing them, so repeat requests share one history load
+activity = Activity()
+profiler = profiling.Profiler(threshold=float(getenv('profile_threshold', '2')), out=getenv('profile_dir', 'profiles'))
+
+def price_age() -> dict:
+    updated = prices.snapshot().updated
+    return {(): (dt.datetime.utcnow()-updated).total_seconds()} if updated else {}
+
+# read on every /metrics scrape
+metrics.REGISTRY.gauge('discoin_chart_cache', 'rendered chart cache', lambda: {(k,):v for k,v in quickchart.cache.stats().items()}, ['stat'])
+metrics.REGISTRY.gauge('discoin_price_age_seconds', 'seconds since the last price refresh', price_age)
+metrics.REGISTRY.gauge('discoin_coin_index_size', 'coins in the search index', lambda: {(): len(coin_index)})
+
+DISCORD_LIMIT = 2000 #characters per message
+TXN_PAGE = 20 #txns per `!txns page N`
+ATTACHMENT_LIMIT = 8*1024*1024 #discord's upload limit
+
+async def search_coins(keyword):
+    if len(coin_index):
+        return coin_index.search(keyword)
+    return await store.search_coins(keyword) #index not loaded yet
+
+async def dbck(coin, key='id') -> dict:
+    if len(coin_index):
+        r = coin_index.get(coin, key=key)
+    else:
+        r = (await store.find_coin(coin, key=key) or [None])[0]
     if not r:
         raise CoinNotFound
     else:
-        return r[0]
-
-def get_quickchart_img(post_data: dict):
-    '''returns image file directly'''
-    print('creating chart')
-    url = 'http://192.168.1.207:8888/chart'
-    r = requests.post(url, json=post_data)
-    if r.status_code == requests.codes.ok:
-        with open('chart.png', 'wb') as f:
-            f.write(r.content)
-        print('chart creation True')
-        return True
-    else:
-        print('chart creation False')
-        return False
-
-def get_coinvals(coins:list, vs=['usd']) -> dict:
-    base = 'https://api.coingecko.com/api/v3/simple/price'
-    p = {'ids':','.join(coins),'vs_currencies':','.join(vs)}
-    r = requests.get(base, params=p)
-    return r.json() if r.status_code == 200 else None
-
-def get_stats(orders: list) -> dict:
-    coins = set(x.get('currency') for x in orders) #set of currencies in the user's orders
-    stats = {}
-    coinStats = []
-    print('getting coins')
-    # coinval = get_coinvals(coins)
-    db = client.coin_latest
-    cv = [x for x in db.coin_latest.find({'currency':{'$in':list(coins)}})] #latest values of user currencies
-    coinval = dict(zip([x.get('currency') for x in cv],[x.get(x.get('currency')) for x in cv])) #remap to dict for easy lookup
-    for coin in coins:
-        txns = list(filter(lambda x:x.get('currency')==coin, orders)) #filter orders by this coin
-        buys = [x for x in txns if x.get('price') >= 0] #mining counts as buys
-        sales = [x for x in txns if x.get('price') < 0]
-
-        #old
-        # buyAvg = [x.get('price')/x.get('amount') for x in txns if x.get('price') >= 0]
-        # saleAvg = [-1*x.get('price')/x.get('amount') for x in txns if x.get('price') < 0]
-        #new 22mar22
-        buyAvg = sum([x.get('price') for x in buys])/sum([x.get('amount') for x in buys])
-        if not sales:
-            saleAvg = 0
-        else:
-            saleAvg = sum([x.get('price') for x in sales])/sum([x.get('amount') for x in sales])
-
-        d = {
-            'coin': coin,
-            'coinUSD': coinval.get(coin).get('usd'),  #need to rebuild pymongo call into a dict for this to work
-            'coinOwned': sum([x.get('amount') for x in txns]), #buys are positive amount, sales are negative
-            'usdSpent': sum([x.get('price') for x in buys]),  #doesnt account for mining
-            'avgPurchasePrice': buyAvg,
-            'usdProfit': -1*sum([x.get('price') for x in sales]),
-            'avgProfitPrice': saleAvg,
-            # 'coinVal': coinval.get(coin).get(vs),            
-            # 'avgPurchasePrice': sum(buyAvg)/len(buyAvg),
-            # 'usdProfit': sum([-1*x for x in saleAvg]),  #old; what is this, why did i do this
-            # 'avgProfitPrice': 0 if len(saleAvg) < 1 else sum([x*-1 for x in saleAvg])/len(saleAvg)    #old
-        }
-        d['coinValue'] = d.get('coinOwned')*d.get('coinUSD')
-        if d.get('coinValue') > 0:
-            # d['gainLoss'] = (d.get('coinValue')/d.get('usdSpent')-1)*100
-            d['gainLoss'] = (d.get('coinUSD') - buyAvg)/buyAvg*100
-        else:
-            d['gainLoss'] = 0
-        coinStats.append(d)
-    totalSpent = 0
-    totalValue = 0
-    totalProfit = 0
-    for coin in coinStats:
-        totalSpent += coin.get('usdSpent')
-        totalValue += coin.get('coinValue')
-        totalProfit += coin.get('usdProfit')
-    stats = {
-        'summary':
-            {'totalValue': totalValue,
-            'totalSpent': totalSpent,
-            'totalGain': totalValue-totalSpent,
-            'totalProfit': totalProfit,
-            # 'roi': totalValue/totalSpent, #old
-            # 'roi': (totalValue-totalSpent)/totalSpent, #better
-            'roi': (totalValue-(totalSpent-totalProfit))/(totalSpent-totalProfit),
-            'invested': totalSpent-totalProfit,
-            },
-        'coinStats':coinStats}
-    print(stats.get('summary').get('roi'))
+        return r
+
+async def valid_coin(coin_id: str) -> str:
+    '''the canonical coin id for what the user typed (lookups ignore case), or None.
+    checks the local coin reference first; only ids newer than the last refresh_coinlist hit coingecko'''
+    try:
+        return (await dbck(coin_id)).get('id')
+    except CoinNotFound:
+        pass
+    p = {'localization':'false', 'tickers':'false', 'market_data':'false',
+        'community_data':'false', 'developer_data':'false'} #we only care that it exists
+    status, data = await cg.request('/coins/'+coin_id, params=p)
+    return (data or {}).get('id') if status == 200 else None
+
+async def get_quickchart_img(post_data: dict):
+    '''returns a discord File backed by an in-memory png, or None'''
+    img = await quickchart.render(post_data)
+    return File(img, filename='chart.png') if img else None
+
+async def load_prices(coins):
+    '''fill the price cache for any coins it doesn't have yet: from coin_latest (startup), then
+    from /coins/markets for coins nobody held at the last refresh (right after a new buy or import)'''
+    missing = prices.missing(coins)
+    metrics.cache('prices', not missing)
+    if missing:
+        cv = await store.latest(missing)
+        prices.merge({x.get('currency'):x.get(x.get('currency')) for x in cv})
+    missing = prices.missing(coins)
+    if missing:
+        coinvals = [{c:from_market(row), 'currency':c} for c,row in (await cg.markets(missing)).items()]
+        await store.upsert_latest(coinvals)
+        prices.merge({x.get('currency'):x.get(x.get('currency')) for x in coinvals})
+
+def get_stats(positions: dict, realized: list=None) -> dict:
+    '''portfolio stats from a user's positions ({currency: totals}, see store.user_positions).
+    `realized` is tax.realized() output; if given, realized gains are included'''
+    snapshot = prices.snapshot() #latest values from the scheduler, no db round trip
+    with profiling.span('get_stats'):
+        stats = portfolio.stats(positions, snapshot.prices, None if realized is None else tax.summary(realized))
+    stats.get('summary').update({'pricesVersion': snapshot.version, 'pricesUpdated': snapshot.updated})
     return stats
 
-def coin_hist(coin_id: str, days) -> dict:
-    d = (dt.datetime.now()-dt.timedelta(days=int(days))).strftime('%d-%m-%Y')
-    url = 'https://api.coingecko.com/api/v3/coins/'+coin_id+'/history'
-    p = {'date':d}
-    r = requests.get(url, params=p)
-    print(r.request.url)
-    if not r.status_code == 200:
-        print(r.status_code)
-        raise error        
-    else:
-        val = r.json().get('market_data').get('current_price').get('usd')
-        return val
-
-def coin_market(coin_id: str, days) -> dict:
+def market_summary(prices: list, days) -> dict:
+    '''turns a price series into dates, % change from the first point, and start/current usd prices'''
+    expectedDate = (dt.datetime.today() - dt.timedelta(days=int(days))).strftime('%Y-%m-%d')
+    unixdates, values = zip(*[(d,v) for d,v in prices])
+    dates = [dt.datetime.utcfromtimestamp(d/1000).strftime('%Y-%m-%d') for d in unixdates]
+    pcts = [(values[n]-values[0])/values[0]*100 for n in range(len(values))]
+    current = values[-1]
+    oldest = (dt.datetime.today()-dt.datetime.utcfromtimestamp(unixdates[0]/1000)).days
+    err = True if dates[0] != expectedDate else False
+    return {'dates': dates, 'values': pcts, 'start': values[0], 'current': current, 'error':err, 'oldest': oldest, 'oldestDate':dates[0]}
+
+async def coin_market(coin_id: str, days) -> dict:
     '''given a coin_id and # days in the past,
     returns a dict with dates and corresponding % change from the previous day'''
-    url = 'https://api.coingecko.com/api/v3/coins/'+coin_id+'/market_chart/'
-    p = {'vs_currency':'usd','days':str(days)}
-    expectedDate = (dt.datetime.today() - dt.timedelta(days=int(days))).strftime('%Y-%m-%d')
-    if int(days) >= 30:
-        p['interval'] = 'daily'
-    r = requests.get(url, params=p)
-    print(r.request.url)
-    if r.status_code == 200:
-        prices = r.json().get('prices')
-        unixdates, values = zip(*[(d,v) for d,v in prices])
-        dates = [dt.datetime.utcfromtimestamp(d/1000).strftime('%Y-%m-%d') for d in unixdates]
-        pcts = [(values[n]-values[0])/values[0]*100 for n in range(len(values))]
-        current = values[-1]
-        oldest = (dt.datetime.today()-dt.datetime.utcfromtimestamp(unixdates[0]/1000)).days
-        print(dates[0], expectedDate)
-        err = True if dates[0] != expectedDate else False
-        return {'dates': dates, 'values': pcts, 'current': current, 'error':err, 'oldest': oldest, 'oldestDate':dates[0]}
-    else:
-        print(r.status_code, r.json())
-        raise error
-
-def tax_dates(txns: list) -> dict:
-    '''return tax dates for a set of txns'''
-    txns = sorted(txns, key=lambda x: x.get('date'), reverse=True)
-    txn_set = set([x.get('date') for x in txns])
-
-def file_import(attachment, source):
-    '''import data from csv depending on export?'''
-    if source == 'coinbase':
-        import csv
-    with open(attachment) as csvfile:
-        data = [x for x in csv.reader(csvfile)]
-    cb_txns = [dict(zip(data[0],y)) for y in data[1:]]
-        # this won't work for deposits!  
-        # coinbase deposits (and withdrawals?) don't have an order id, they have a 'trade id'
-    uids = set([x.get('order id') for x in cb_txns]) #combine USD match, coin match, and fee txns into single dict
-    txns = []
-    for uid in filter(bool,uids):
-        d = {'cborderid':uid}
-        for c in filter(lambda x: x.get('order id')==uid, cb_txns):
-            if c.get('type') is not 'fee' and c.get('amount/balance unit') == 'USD':
-                d['price'] = abs(float(c.get('amount')))
-            d['date'] = dt.datetime.strptime(c.get('time'),'%Y-%m-%dT%H:%M:%S.%fZ').strftime('%Y-%m-%d')
-            if c.get('amount/balance unit') != 'USD':
-                d['amount'] = c.get('amount')
-                d['currency'] = c.get('amount/balance unit')
-            else:
-                d['price'] = c.get('amount')
-        txns.append(d)
-    return True
+    prices = await market_series.window(coin_id, days) #cached series, only the missing tail is fetched
+    return market_summary(prices, days)
+
+async def coin_markets(coin_ids: list, days) -> dict:
+    '''coin_market for several coins at once, keyed by coin id'''
+    series = await market_series.windows(coin_ids, days)
+    return {c: market_summary(prices, days) for c,prices in series.items()}
+
+async def realized_gains(userid: str, method: str='fifo') -> list:
+    '''tax lots for a user's whole history, cached until they next write a txn.
+    while one is being computed, other callers for the same user and method wait on it'''
+    records = tax_cache.get(userid, method)
+    metrics.cache('tax', records is not None)
+    if records is not None:
+        return records
+    key = (userid, method)
+    task = tax_inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_realized_gains(userid, method))
+        tax_inflight[key] = task
+        task.add_done_callback(lambda _: tax_inflight.pop(key, None))
+    # shield so one caller being cancelled doesn't cancel it for the rest
+    return await asyncio.shield(task)
+
+async def _realized_gains(userid: str, method: str) -> list:
+    generation = tax_cache.generation(userid)
+    txns = await store.user_txns(userid)
+    with profiling.span('tax.realized'):
+        records = await asyncio.get_event_loop().run_in_executor(None, tax.realized, txns, method)
+    tax_cache.put(userid, method, records, generation)
+    return records
 
 class Scheduler(commands.Cog):
     def __init__(self, bot):
-        self.index = 0
         self.bot = bot
-        print('Scheduler loaded.')
+        self.jobs = {
+            'cleanup': Job('cleanup', jitter=600),
+            'refresh_coinlist': Job('refresh_coinlist', jitter=600),
+            'update_coinvals': Job('update_coinvals', jitter=20),
+            }
+        self.waking = False #a restart is on its way, until the restarted loop runs
+        log.info('Scheduler loaded')
         self.cleanup.start()
         self.refresh_coinlist.start()
         self.update_coinvals.start()
 
     def cog_unload(self):
+        self.cleanup.stop()
         self.update_coinvals.stop()
         self.refresh_coinlist.stop()
 
     @tasks.loop(hours=24)
     async def cleanup(self):
-        removeableFiles = [f for f in listdir() if f.endswith(('png','json'))]
-        for f in removeableFiles:
-            remove(f)
-        print(f'{len(removeableFiles)} removed.')
-        return
+        await self.jobs.get('cleanup')(self._cleanup)
 
     @tasks.loop(hours=24)
     async def refresh_coinlist(self):
-        db = client.coinref
-        r = requests.get('https://api.coingecko.com/api/v3/coins/list')
-        if r.status_code == 200:
-            db.coinref.delete_many({})
-            db.coinref.insert_many(r.json())
-            print('coin reference updated')
+        await self.jobs.get('refresh_coinlist')(self._refresh_coinlist)
 
     @tasks.loop(minutes=5)
-    async def update_coinvals(self, vs=['usd']):
-        '''replaces coin_latest collection with up-to-date data from /simple/price'''
-        db = client.txns
-        coins = list(set([x.get('currency') for x in db.txns.find()]))
-        print(f'updating values for {coins}')
-        base = 'https://api.coingecko.com/api/v3/simple/price'
-        p = {'ids':','.join(coins),'vs_currencies':','.join(vs)}
-        r = requests.get(base, params=p)
-        if r.status_code == 200:
-            coinvals = [{k:v, 'currency':k} for k,v in r.json().items()] # `currency` field reqd for filtering
-            db = client.coin_latest
-            db.coin_latest.delete_many({})
-            db.coin_latest.insert_many(coinvals)
-            print(f'{len(coinvals)} coin values updated')
+    async def update_coinvals(self):
+        self.waking = False
+        coins = await self.jobs.get('update_coinvals')(self._update_coinvals)
+        # refresh faster while people are using the bot, within the api budget; back off when idle
+        minutes = price_interval(activity.idle_for(), coins or 0, bool(alerts.coins()), cg.bucket.fill*60)
+        if minutes != self.update_coinvals.minutes:
+            log.info('price refresh interval changed', extra={'minutes':round(minutes, 1)})
+            self.update_coinvals.change_interval(minutes=minutes)
+
+    def wake(self):
+        '''someone's back after an idle stretch: refresh prices now instead of at the slow interval'''
+        # commands arriving together would each restart() before the new task runs, and the
+        # extra restarts' start() calls fail with "Task is already launched"
+        if self.waking or self.jobs.get('update_coinvals').running:
+            return
+        if self.update_coinvals.minutes > 5:
+            self.waking = True
+            self.update_coinvals.restart()
+
+    async def _cleanup(self):
+        removeableFiles = [f for f in listdir() if f.endswith('.json')] #leftover exports from before they were built in memory
+        for f in removeableFiles:
+            remove(f)
+        log.info('old exports removed', extra={'files':len(removeableFiles)})
+        return
+
+    async def _refresh_coinlist(self):
+        status, coinlist = await cg.request('/coins/list')
+        if status == 200:
+            counts = await store.sync_coinref(coinlist)
+            log.info('coin reference updated', extra=counts)
+        elif not len(coin_index):
+            coinlist = await store.all_coins() #coingecko is down, index whatever we had
+        else:
+            return
+        await asyncio.get_event_loop().run_in_executor(None, coin_index.build, coinlist)
+        log.info('coin index rebuilt', extra={'coins':len(coin_index)})
+
+    async def _update_coinvals(self, vs=['usd']) -> int:
+        '''upserts up-to-date data from /coins/markets (one call per 250 coins) into the coin_latest collection'''
+        coins = list(set(await store.tracked_currencies()) | set(alerts.coins())) #held or watched
+        vals = {}
+        for v in vs:
+            for coin,row in (await cg.markets(coins, vs_currency=v)).items():
+                vals.setdefault(coin, {}).update(from_market(row, v))
+        coinvals = [{k:v, 'currency':k} for k,v in vals.items()] # `currency` field reqd for filtering
+        await store.upsert_latest(coinvals, tracked=coins)
+        # keep the old price for any coin whose chunk failed, then swap the whole snapshot at once
+        old = prices.snapshot().prices
+        fresh = {c:old.get(c) for c in coins if c in old}
+        fresh.update({x.get('currency'):x.get(x.get('currency')) for x in coinvals})
+        prices.swap(fresh)
+        log.info('coin values updated', extra={'tracked':len(coins), 'updated':len(coinvals)})
+        await alerts.evaluate(fresh)
+        return len(coins)
 
 bot = commands.Bot(command_prefix='!')
+
+# profiling and latency wrap the command itself (after argument conversion), error handlers aren't counted.
+# the invoke hooks run inline with the command, unlike on_command listeners which are separate tasks
+@bot.before_invoke
+async def start_profile(ctx):
+    profiler.start(ctx)
+
+@bot.after_invoke
+async def finish_profile(ctx):
+    profiler.finish(ctx)
+    metrics.COMMANDS.observe(ctx.span.duration, command_name(ctx))
+
+@bot.listen('on_command')
+async def mark_activity(ctx):
+    activity.mark()
+    bot.get_cog('Scheduler').wake()
+
+def command_name(ctx) -> str:
+    return ctx.command.qualified_name if ctx.command else 'unknown'
+
+@bot.listen('on_command_error')
+async def count_command_error(ctx, error):
+    error = getattr(error, 'original', error)
+    metrics.COMMAND_ERRORS.inc(command_name(ctx), type(error).__name__)
+    log.info('command failed', extra={'command':command_name(ctx), 'user':str(ctx.author.id), 'error':repr(error)})
+
+async def notify_user(alert: dict, price: float):
+    user = bot.get_user(int(alert.get('userid'))) or await bot.fetch_user(int(alert.get('userid')))
+    msg = f'''🔔 {alert.get("currency")} is now ${"{:,.2f}".format(price)}, {alert.get("op")} your ${"{:,.2f}".format(alert.get("price"))} alert'''
+    await user.send(msg)
+
+alerts = Watchers(store, notify_user)
 bot.add_cog(Scheduler(bot))
 
 class CoinNotFound(CommandError):
@@ -238,9 +277,21 @@ class CoinNotFound(CommandError):
         self.msg = '''CoinNotFound error message: try again nerd'''
         super().__init__(*args, **kwargs)
 
+metrics_server = None
+
 @bot.event
 async def on_ready():
-    print(f'{bot.user} has connected to these guilds:{bot.guilds}')
+    log.info('connected', extra={'user':str(bot.user), 'guilds':[g.name for g in bot.guilds]})
+    await store.ensure_indexes()
+    await store.audit_queries()
+    await store.ensure_positions()
+    await alerts.load()
+    global metrics_server
+    if metrics_server is None: #on_ready fires again after every reconnect
+        try:
+            metrics_server = await metrics.serve(getenv('metrics_host', '127.0.0.1'), int(getenv('metrics_port', '9108')))
+        except OSError as e: #e.g. port taken; the bot runs fine without /metrics, tried again on the next on_ready
+            log.error('metrics server not started', extra={'error':repr(e)})
     msg = Embed(title=":information_source: Discoin updated to v1.3.1",
         description=f'''Changelog: \n 
     • "Live" coin prices are now updated every 5 minutes. `!coin` uses this cached data, to be more friendly to the coingecko API.
@@ -257,9 +308,12 @@ async def cryptohelp(ctx):
         • **`!search [coin]`** search list of supported coins; symbols (`eth`, `btc`) give the best results
         • **`!market [coin] [# days]`** display coin performance starting from N days ago
         • **`!compare [coin1] [coin2] [# days]`** display two coins' performance starting from N days ago
-        • **`!txns`** *`[cryptocurrency]`* show all your txns; or show those with a specific coin
+        • **`!txns`** *`[cryptocurrency] [page N]`* show all your txns; or show those with a specific coin, one page at a time
         • **`!delete [transaction id]`** remove one of your txns by id; use `!txns` first
-        • **`!export`** pm you your data in JSON format
+        • **`!tax`** *`[year] [fifo|lifo|hifo]`* pm you realized short and long term gains for a year
+        • **`!import`** *`[exchange]`* attach a csv export (coinbase) to add all its orders; re-importing skips duplicates
+        • **`!export`** *`[json|jsonl|csv] [gz]`* pm you your data, JSON by default; `gz` compresses it
+        • **`!watch [coin] [above|below] [$USD]`** or **`!watch [coin] [+/-N%]`** dm you once when the price gets there; `!watches` lists them, `!unwatch [id]` removes one
         • **`!wipe`** remove all your data from this bot
         • **`!discoindev [message]`** send a message to the devs
 
@@ -272,16 +326,15 @@ async def cryptohelp(ctx):
         Market data powered by CoinGecko
         ''',
         color=Color.orange())
-    print(len(msg))
     await ctx.send(embed=msg)
     # await ctx.author.send(embed=msg)
 
 @bot.command(name="buy")
 async def _buy(ctx, amount, currency, price, date=None):
     '''add a purchase to your portfolio. if no date is provided, today's date will be used.'''
-    r = requests.get('https://api.coingecko.com/api/v3/coins/'+currency)
-    if not r.status_code == 200:
-        coinList = search_coins(currency)
+    coin = await valid_coin(currency)
+    if not coin:
+        coinList = await search_coins(currency)
         msg = '''Coin not found. Did you mean one of these?
     • `!buy` and `!sell` use coin **`id`** (no caps, use dashes instead of spaces)
     • comparison arguments need **`symbol`**
@@ -296,15 +349,14 @@ async def _buy(ctx, amount, currency, price, date=None):
             date = dt.datetime.today().strftime('%Y-%m-%d')
         txn = {
             'amount': float(amount),
-            'currency': currency,
+            'currency': coin, #canonical id, e.g. `Bitcoin` is stored as bitcoin
             'price': float(price),
             'date': date,
             'userid':str(ctx.author.id)
             }
-        db = client.txns
-        db.txns.insert_one(txn)
+        await store.add_txn(txn)
         await ctx.message.add_reaction('✅')
-        await ctx.author.send(f'{ctx.author.name} bought {amount} {currency} for {price} USD')
+        await ctx.author.send(f'{ctx.author.name} bought {amount} {coin} for {price} USD')
 
 @bot.command(name="sell")
 async def _sell(ctx, amount, currency, price, date=None):
@@ -314,13 +366,15 @@ async def _sell(ctx, amount, currency, price, date=None):
 @bot.command(name="coin")
 async def _coin(ctx, flex=None, vs=None):
     '''pm you your portfolio'''
-    db = client.txns
-    userTxns = [x for x in db.txns.find({'userid':str(ctx.author.id)})]
-    if not userTxns:
+    positions = await store.user_positions(str(ctx.author.id))
+    if not positions:
         msg = "No orders found. Add crypto purchases to your portfolio with: ```!txn {amount of crypto} {cryptocurrency} {$USD paid}```"
         embed = None
     else:
-        stats = get_stats(userTxns)
+        await load_prices(positions)
+        # realized gains only if a !tax already computed them, so a long history never slows !coin
+        realized = tax_cache.get(str(ctx.author.id), 'fifo')
+        stats = get_stats(positions, realized)
         sstats = sorted(stats.get('coinStats'), key=lambda x:x.get('coinValue'), reverse=True)
         pv = "{:,.2f}".format(stats.get('summary').get('totalValue'))
         # roi = round(stats.get('summary').get('totalValue')/stats.get('summary').get('totalSpent')*100-100,2)
@@ -330,8 +384,14 @@ async def _coin(ctx, flex=None, vs=None):
         profit = "{:,.2f}".format(stats.get("summary").get("totalProfit"))
         desc = 'amt coin ROI% (value)'
         for coin in sstats:
-            desc += f'''\n**{round(coin.get("coinOwned"), 2)} {coin.get("coin")} {round(coin.get("gainLoss"), 2)}% \
-            (${"{:.2f}".format(coin.get("coinValue"))})**
+            if not coin.get("priced"):
+                desc += f'\n**{round(coin.get("coinOwned"), 2)} {coin.get("coin")}** no price yet'
+            else:
+                desc += f'''\n**{round(coin.get("coinOwned"), 2)} {coin.get("coin")} {round(coin.get("gainLoss"), 2)}% \
+            (${"{:.2f}".format(coin.get("coinValue"))})**'''
+            if coin.get("change24h") is not None:
+                desc += f' {round(coin.get("change24h"), 2)}% 24h'
+            desc += f'''
                     | spent (${"{:.2f}".format(coin.get("usdSpent"))}) @ avg ${"{:.2f}".format(coin.get("avgPurchasePrice"))}'''
             if coin.get("usdProfit") > 0:
                 desc+=f'''\n | sold ${"{:.2f}".format(coin.get("usdProfit"))} @ avg ${"{:.2f}".format(coin.get("avgProfitPrice"))}'''
@@ -340,11 +400,17 @@ async def _coin(ctx, flex=None, vs=None):
         coinNames  = [c.get('coin') for c in sstats]
         roiChart = {'chart': {'type': 'bar', 'data': {'labels': coinNames,
             'datasets': [{'label': 'ROI per coin (%)', 'data':roiList, 'backgroundColor':'#db9d16'}]}},'backgroundColor': '#2f3136'}
-        chartfile = File("chart.png") if get_quickchart_img(roiChart) else None
+        chartfile = await get_quickchart_img(roiChart)
         
-        embed = Embed(title=f':coin:  {ctx.author.name}\'s Portfolio: ${pv} \n {roi}% ROI for ${invested} invested \n ${profit} realized',
+        title = f':coin:  {ctx.author.name}\'s Portfolio: ${pv} \n {roi}% ROI for ${invested} invested \n ${profit} realized'
+        if stats.get('summary').get('realizedGain') is not None:
+            title += f' (${"{:,.2f}".format(stats.get("summary").get("realizedGain"))} gain, FIFO)'
+        embed = Embed(title=title,
             description=desc, color=Color.dark_gold(), type='rich')
         embed.set_image(url=f'attachment://chart.png')
+        updated = stats.get('summary').get('pricesUpdated')
+        if updated:
+            embed.set_footer(text=f'prices as of {updated.strftime("%Y-%m-%d %H:%M")} UTC (v{stats.get("summary").get("pricesVersion")})')
 
         if flex:
             await ctx.channel.send(flex, embed=embed, file=chartfile)
@@ -355,7 +421,7 @@ async def _coin(ctx, flex=None, vs=None):
 @bot.command(name="flex")
 async def _flex(ctx, target: Member=None):
     '''flex on the boys. tag a boy to flex on him'''
-    if blocked(user=(ctx.author.name+'#'+ctx.author.discriminator), type='flex'):
+    if await blocked(user=(ctx.author.name+'#'+ctx.author.discriminator), type='flex'):
         return
     if target:
         msg = f'{ctx.author.mention} 💪FLEXED💪 ON {target.mention}'
@@ -371,7 +437,7 @@ async def flex_error(ctx, error):
 @bot.command(name="search")
 async def _search(ctx, keyword):
     '''search for supported coins. favors symbol'''
-    coinList = search_coins(keyword=keyword)
+    coinList = await search_coins(keyword=keyword)
     msg = f'''Here are the first 10 results for `{keyword}`: \nSymbol \t | \t Name \t | \t id'''
     for coin in coinList[:10]:
         msg+=f'''```{coin.get("symbol")}\t{coin.get("name")}\t{coin.get("id")}```'''
@@ -383,49 +449,46 @@ async def _search(ctx, keyword):
 @bot.command(name="market")
 async def _market(ctx, coin_id, days='90', vs='usd'):
     '''get data for x'''
-    coin = dbck(coin_id).get('id')
-    data = coin_market(coin, days=days)
+    coin = (await dbck(coin_id)).get('id')
+    data = await coin_market(coin, days=days)
     #error handling for `/market_chart` which returns 200 json() without 'market_data' if date is too old
     if data.get('error') == True:
         await ctx.channel.send(f'Rerunning with oldest available date ({days} days ago)')
         days = data.get('oldest')
-        data = coin_market(coin,days=days)
-    coinval_date = coin_hist(coin, days=days)
-    print(type(coinval_date), coinval_date)
-    print(type(data), data.get('values'))
+        data = await coin_market(coin,days=days)
+    coinval_date = data.get('start')
     chart = {'chart':{'type':'line', 'data':{
         'labels':data.get('dates'),
         'datasets':[{'label':coin,'data':data.get('values'),'borderWidth':1, 'pointRadius':1, 'fill': 'False'}],
         }},
         'backgroundColor':'#2f3136',
         }
-    chartfile = File("chart.png") if get_quickchart_img(chart) else None
+    chartfile = await get_quickchart_img(chart)
     emb = Embed(title=f'{coin} % change since {data.get("dates")[0]}',
         description=f'{coin}: {round(data.get("values")[-1],4)}% from {round(coinval_date,2)} {vs} to {round(data.get("current"),2)}', type='rich')
     emb.set_image(url=f'attachment://chart.png')
     await ctx.channel.send(embed=emb,file=chartfile)
 @_market.error
 async def _market_error(ctx, error):
-    print('error')
     if isinstance(error, CoinNotFound):
         await ctx.channel.send(error.msg)
+    elif isinstance(getattr(error, 'original', None), CoinGeckoError):
+        await ctx.channel.send('CoinGecko is having trouble right now, try again in a minute')
 
 @bot.command(name="compare")
 async def _compare(ctx, id1, id2, days='90'):
     # try up to x coins, if ValueError that should be the date, else days=90
     '''compare performance of 2 coin_ids over X days'''
-    c1 = dbck(id1)
-    c2 = dbck(id2)
-    c1market = coin_market(c1.get('id'), days=days)
-    c2market = coin_market(c2.get('id'), days=days)
+    c1, c2 = await asyncio.gather(dbck(id1), dbck(id2))
+    markets = await coin_markets([c1.get('id'), c2.get('id')], days=days)
+    c1market, c2market = markets.get(c1.get('id')), markets.get(c2.get('id'))
     #error handling for `/market_chart` which returns 200 json() without 'market_data' if date is too old
     if c1market.get("oldestDate") != c2market.get("oldestDate"): 
         days = min([c1market.get("oldest"),c2market.get("oldest")])
         await ctx.channel.send(f'Rerunning with oldest available date ({days} days ago)')
-        c1market = coin_market(c1.get('id'), days=days)
-        c2market = coin_market(c2.get('id'), days=days)
-    c1date = coin_hist(c1.get('id'), days=days)
-    c2date = coin_hist(c2.get('id'), days=days)
+        markets = await coin_markets([c1.get('id'), c2.get('id')], days=days)
+        c1market, c2market = markets.get(c1.get('id')), markets.get(c2.get('id'))
+    c1date, c2date = c1market.get('start'), c2market.get('start')
     chart = {'chart':{'type':'line', 'data':{
         'labels':c1market.get('dates'),
         'datasets':[
@@ -435,7 +498,7 @@ async def _compare(ctx, id1, id2, days='90'):
         }},
         'backgroundColor':'#2f3136',
         }
-    chartfile = File("chart.png") if get_quickchart_img(chart) else None
+    chartfile = await get_quickchart_img(chart)
     emb = Embed(title=f'{id1} vs {id2} relative % change since {c1market.get("dates")[0]}',
         description=f'{id1}: {round(c1market.get("values")[-1],4)}% from ${"{:,.2f}".format(c1date)} to ${round(c1market.get("current"),2)}\n \
             {id2}: {round(c2market.get("values")[-1],4)}% from ${"{:,.2f}".format(c2date)} to ${round(c2market.get("current"),2)}', type='rich') 
@@ -444,58 +507,183 @@ async def _compare(ctx, id1, id2, days='90'):
 @_compare.error
 async def _compare_error(ctx, error):
     if isinstance(error, CoinNotFound):
-        print(error.msg)
         await ctx.channel.send(error.msg)
+    elif isinstance(getattr(error, 'original', None), CoinGeckoError):
+        await ctx.channel.send('CoinGecko is having trouble right now, try again in a minute')
+
+async def send_packed(dest, msg: str, lines) -> str:
+    '''appends lines to msg, sending it whenever the next line would pass discord's 2k char limit.
+    returns what's left unsent'''
+    for line in lines:
+        if len(msg)+len(line) > DISCORD_LIMIT:
+            await dest.send(msg)
+            msg = ''
+        msg += line
+    return msg
+
+def txn_line(d: dict) -> str:
+    return f'\n`{str(d.get("_id"))}` *${d.get("price")} exchanged for {d.get("amount")} {d.get("currency")} on {d.get("date")}*'
+
+@bot.command(name="tax")
+async def _tax(ctx, year=None, method='fifo'):
+    '''pm you realized gains for a tax year, matching sales to buys by fifo, lifo or hifo'''
+    if year in tax.METHODS:
+        year, method = None, year
+    if method not in tax.METHODS:
+        await ctx.channel.send(f'Method must be one of {", ".join(tax.METHODS)}')
+        return
+    year = int(year) if year else dt.datetime.today().year
+    records = await realized_gains(str(ctx.author.id), method)
+    s = tax.summary(records, year)
+    total = s.get('total')
+    desc = f'''Proceeds ${"{:,.2f}".format(total.get("proceeds"))} | cost basis ${"{:,.2f}".format(total.get("cost"))}
+    **Short term: ${"{:,.2f}".format(total.get("short"))}**
+    **Long term: ${"{:,.2f}".format(total.get("long"))}**'''
+    for coin,c in sorted(s.get('coins').items(), key=lambda x: -abs(x[1].get('short')+x[1].get('long'))):
+        line = f'\n{coin}: short ${"{:,.2f}".format(c.get("short"))}, long ${"{:,.2f}".format(c.get("long"))}'
+        if len(desc)+len(line) > 4000: #embed description limit
+            desc += '\n...'
+            break
+        desc += line
+    if not records or not total.get('matches'):
+        desc = f'No sales in {year}.'
+    embed = Embed(title=f':receipt:  {ctx.author.name}\'s {year} realized gains ({method.upper()})',
+        description=desc, color=Color.dark_gold(), type='rich')
+    await ctx.author.send(embed=embed)
 
 @bot.command(name="txns")
-async def _txns(ctx, coin=None):
-    '''find all your txns with a specific coin'''
-    db = client.txns
-    searchTerms = {'userid':str(ctx.author.id)}
-    if coin:
-        searchTerms['currency'] = coin
-    data = [x for x in db.txns.find(searchTerms)]
+async def _txns(ctx, *args):
+    '''find all your txns, optionally with a specific coin. `page N` shows one page at a time'''
+    args = list(args)
+    page = None
+    if 'page' in args:
+        i = args.index('page')
+        try:
+            page = int(args[i+1]) if len(args) > i+1 else 1
+        except ValueError:
+            page = 0
+        if page < 1:
+            await ctx.channel.send('Page must be a number from 1 up, e.g. `!txns page 2` or `!txns btc page 2`')
+            return
+        del args[i:i+2]
+    coin = args[0] if args else None
     msg = "Your transactions"
     if coin: 
         msg += f" with {coin}"
+    if page:
+        msg += f" (page {page})"
     msg+= f'\n To delete a transaction, find the txn id and type `!delete [txnid]`'
-    chunked = list(chunker(data,20))
-    for l in chunked:                       #discord's 2k char limit is hit @ ~25 txns
-        for d in l:
-            msg+= f'\n`{str(d.get("_id"))}` *${d.get("price")} exchanged for {d.get("amount")} {d.get("currency")} on {d.get("date")}*'
-            # if dt.datetime.today() - dt.strptime(d.get('date'), '%Y-%m-%d') > 365:
-                # msg+= f'\n```css\n{str(d.get("_id"))}` *${d.get("price")} exchanged for {d.get("amount")} {d.get("currency")} on {d.get("date")}*'
+    if page:
+        data, more = await store.txn_page(str(ctx.author.id), coin=coin, page=page, size=TXN_PAGE)
+        lines = [txn_line(d) for d in data]
+        if more:
+            lines.append(f'\nNext page: `!txns {coin+" " if coin else ""}page {page+1}`')
+        msg = await send_packed(ctx.author, msg, lines)
+    else:
+        async for docs in store.iter_txns(str(ctx.author.id), coin=coin):
+            msg = await send_packed(ctx.author, msg, map(txn_line, docs))
+    if msg:
         await ctx.author.send(msg)
-        msg = ""
 
 @bot.command(name="delete")
 async def _delete(ctx, txnid):
     '''remove a txn from your orders by id'''
-    db = client.txns
-    db.txns.delete_one({'_id':ObjectId(txnid), 'userid':str(ctx.author.id)})
+    await store.delete_txn(str(ctx.author.id), txnid)
     await ctx.message.add_reaction('✅')
 
 @bot.command(name="export")
-async def _export(ctx):
-    '''pm you your data in JSON format'''
+async def _export(ctx, fmt='json', compress=None):
+    '''pm you your data as json, jsonl or csv; add `gz` to compress it'''
     auth = str(ctx.author.id)
-    db = client.txns
-    data = [x for x in db.txns.find({'userid':auth})]
-    for d in data:
-        d['_id'] = str(d.get('_id'))
-    export = {'txns':data}
-    with open(f'{auth}.json', 'w', encoding='utf-8') as f:
-        json.dump(export, f, indent=4, ensure_ascii=False, separators=(',', ':'), sort_keys=True)
-    await ctx.author.send(file=File(f'{auth}.json'))
+    if fmt not in exports.FORMATS:
+        await ctx.channel.send(f'Export format must be one of {", ".join(exports.FORMATS)}')
+        return
+    gz = compress == 'gz'
+    buf = await exports.export_buffer(store.iter_txns(auth, projection=None), fmt=fmt, compress=gz)
+    if buf.getbuffer().nbytes > ATTACHMENT_LIMIT and not gz:
+        gz = True #too big for discord, try again compressed
+        buf = await exports.export_buffer(store.iter_txns(auth, projection=None), fmt=fmt, compress=gz)
+    if buf.getbuffer().nbytes > ATTACHMENT_LIMIT:
+        await ctx.author.send('Your export is too big for a discord attachment, even compressed.')
+        return
+    await ctx.author.send(file=File(buf, filename=exports.filename(auth, fmt, gz)))
     await ctx.message.add_reaction('✅')
 
+def resolve_symbol(symbol: str) -> str:
+    '''coin id for an exchange ticker; among coins sharing a symbol, prefer one somebody already holds'''
+    matches = [c for c in coin_index.search(symbol) if c.get('symbol') == symbol.lower()]
+    held = prices.snapshot().prices
+    for c in matches:
+        if c.get('id') in held:
+            return c.get('id')
+    return matches[0].get('id') if matches else None
+
+@bot.command(name="import")
+async def _import(ctx, source='coinbase'):
+    '''import txns from an exchange csv attached to the message'''
+    if source not in imports.PARSERS:
+        await ctx.channel.send(f'I can import from: {", ".join(imports.PARSERS)}')
+        return
+    if not ctx.message.attachments:
+        await ctx.channel.send('Attach your exchange csv export to the `!import` message.')
+        return
+    data = await ctx.message.attachments[0].read()
+    txns, skipped = await asyncio.get_event_loop().run_in_executor(None, imports.parse, data, source, resolve_symbol)
+    counts = await store.import_txns(str(ctx.author.id), txns)
+    await ctx.message.add_reaction('✅')
+    await ctx.author.send(f'Imported {counts.get("inserted")} {source} txns, {counts.get("duplicates")} already imported, {skipped} rows skipped')
+
+@bot.command(name="watch")
+async def _watch(ctx, coin_id, op, price=None):
+    '''dm you when a coin goes above/below a usd price, or moves +/-N% from now'''
+    coin = (await dbck(coin_id)).get('id')
+    try:
+        if op.endswith('%'):
+            pct = float(op.rstrip('%'))
+            if pct == 0 or pct <= -100:
+                raise ValueError(f'{op} would fire right away or never')
+            await load_prices([coin])
+            current = (prices.snapshot().prices.get(coin) or {}).get('usd')
+            if current is None:
+                await ctx.channel.send(f'No price for {coin} yet, try a $ threshold instead')
+                return
+            op, price = ('above' if pct > 0 else 'below'), current*(1+pct/100)
+        alert = await alerts.add(str(ctx.author.id), coin, op, float(price))
+    except (TypeError, ValueError) as e:
+        await ctx.channel.send(f'Usage: `!watch [coin] [above|below] [$USD]` or `!watch [coin] [+/-N%]` ({e})')
+        return
+    await ctx.message.add_reaction('✅')
+    await ctx.author.send(f'Watching {coin} {op} ${"{:,.2f}".format(alert.get("price"))} until {alert.get("expires").strftime("%Y-%m-%d")} (`{alert.get("_id")}`)')
+@_watch.error
+async def _watch_error(ctx, error):
+    if isinstance(error, CoinNotFound):
+        await ctx.channel.send(error.msg)
+
+@bot.command(name="watches")
+async def _watches(ctx):
+    '''pm you your price alerts'''
+    mine = [a for a in alerts.index.alerts.values() if a.get('userid') == str(ctx.author.id)]
+    msg = 'Your price alerts. To remove one type `!unwatch [id]`'
+    for a in sorted(mine, key=lambda x: (x.get('currency'), x.get('price'))):
+        msg += f'\n`{a.get("_id")}` {a.get("currency")} {a.get("op")} ${"{:,.2f}".format(a.get("price"))}'
+    if not mine:
+        msg = 'No price alerts. Add one with `!watch [coin] [above|below] [$USD]`'
+    await ctx.author.send(msg)
+
+@bot.command(name="unwatch")
+async def _unwatch(ctx, alertid):
+    '''remove one of your price alerts by id'''
+    if await alerts.remove(str(ctx.author.id), alertid):
+        await ctx.message.add_reaction('✅')
+    else:
+        await ctx.message.add_reaction('❓')
+
 @bot.command(name="wipe")
 async def _wipe(ctx):
     '''remove all your data from this bot'''
-    db = client.txns
-    db.txns.delete_many({'userid':str(ctx.author.id)})
-    ck = [x for x in db.txns.find({'userid': str(ctx.author.id)})]
-    if len(ck) == 0:
+    await alerts.remove_user(str(ctx.author.id))
+    ck = await store.wipe_user(str(ctx.author.id))
+    if ck == 0:
         await ctx.message.add_reaction('✅')
         await ctx.author.send('nice knowing you')
     else:
@@ -508,7 +696,7 @@ async def _wipe(ctx):
 @bot.command(name="discoindev")
 async def _contactdev(ctx):
     '''send a message to the devs'''
-    if blocked(user=(ctx.author.name+'#'+ctx.author.discriminator), type='dev'):
+    if await blocked(user=(ctx.author.name+'#'+ctx.author.discriminator), type='dev'):
         return
     embed = Embed(title=f'🔧 Dev Message from {ctx.author.name}#{ctx.author.discriminator}', type='rich',
         description=f'{ctx.author.display_name} ({ctx.author.id}) from {ctx.message.guild} says: {ctx.message.content}',
@@ -521,20 +709,25 @@ async def dev_error(ctx, error):
         await ctx.channel.send(f'{ctx.author.display_name} please try again later')
 
 @bot.command(name="ddev")
-async def _ddev(ctx):
+async def _ddev(ctx, action=None, rate=None):
     if not ctx.author.id == 126768317024305152:
         await ctx.message.add_reaction('🛑')
         return
+    elif action == 'profile':
+        # `!ddev profile` toggles, `!ddev profile 0.1` samples 10% of commands
+        profiler.sample = float(rate) if rate is not None else (0 if profiler.sample else 1)
+        msg = f'cProfile sampling {profiler.sample:.0%} of commands; {profiler.slow} over {profiler.threshold}s so far, dumped to `{profiler.out}`'
     else:
         msg = f'''
+        • **`!ddev profile`** *`[rate]`* toggle cProfile sampling of commands, or sample a fraction of them
         • **`!devblock [userid] [type]`** userid is a name, type = flex or /
+        • **`!devjobs`** scheduler run times, errors and skipped runs
+        • **`!devrebuild`** *`[userid]`* regenerate portfolio positions from txns for one user or everyone
         '''
     await ctx.author.send(msg)
 
-def blocked(user: str, type: str) -> bool:
-    db = client.blocked
-    blocked = [x for x in db.blocked.find({'userid':user, 'type':type})]
-    return True if blocked else False
+async def blocked(user: str, type: str) -> bool:
+    return await store.is_blocked(user, type)
 
 @bot.command(name="devblock")
 async def _devblock(ctx, userid, kw):
@@ -542,8 +735,7 @@ async def _devblock(ctx, userid, kw):
         await ctx.message.add_reaction('🛑')
         return
     else:
-        db = client.blocked
-        db.blocked.insert_one({'user':userid, 'type':kw})
+        await store.block(userid, kw)
         await ctx.message.add_reaction('✅')
 
 @bot.command(name="devunblock")
@@ -552,8 +744,31 @@ async def _devblock(ctx, userid, kw):
         await ctx.message.add_reaction('🛑')
         return
     else:
-        db = client.blocked
-        db.blocked.delete_one({'user':userid, 'type':kw})
+        await store.unblock(userid, kw)
+        await ctx.message.add_reaction('✅')
+
+@bot.command(name="devjobs")
+async def _devjobs(ctx):
+    if not ctx.author.id == 126768317024305152:
+        await ctx.message.add_reaction('🛑')
+        return
+    else:
+        sched = bot.get_cog('Scheduler')
+        msg = f'idle {activity.idle_for()/60:.0f}m, prices every {sched.update_coinvals.minutes:.1f}m'
+        for job in sched.jobs.values():
+            st = job.stats()
+            last = st.get('last') or {}
+            msg += f'''\n**{st.get("name")}** {st.get("runs")} runs, avg {st.get("avg"):.2f}s, max {st.get("max"):.2f}s, \
+{st.get("errors")} errors, {st.get("skipped")} skipped; last: {last.get("outcome")}'''
+    await ctx.author.send(msg)
+
+@bot.command(name="devrebuild")
+async def _devrebuild(ctx, userid=None):
+    if not ctx.author.id == 126768317024305152:
+        await ctx.message.add_reaction('🛑')
+        return
+    else:
+        await store.rebuild_positions(userid)
         await ctx.message.add_reaction('✅')
 
 bot.run(getenv('api_token'))
\ No newline at end of file
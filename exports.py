@@ -0,0 +1,47 @@
+'''builds !export attachments in memory, one batch of txns at a time'''
+import csv
+import gzip
+import io
+import json
+
+FORMATS = ('json', 'jsonl', 'csv')
+CSV_FIELDS = ['_id', 'date', 'currency', 'amount', 'price', 'userid', 'cborderid']
+
+def _row(d: dict) -> dict:
+    d = dict(d)
+    d['_id'] = str(d.get('_id'))
+    return d
+
+async def export_buffer(batches, fmt: str='json', compress: bool=False) -> io.BytesIO:
+    '''writes every txn from the async iterator `batches` (lists of txn docs) into a BytesIO,
+    gzipped if `compress`. json matches the old export file, {"txns": [...]}'''
+    raw = io.BytesIO()
+    sink = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+    out = io.TextIOWrapper(sink, encoding='utf-8', newline='')
+    if fmt == 'csv':
+        writer = csv.DictWriter(out, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+    elif fmt == 'json':
+        out.write('{"txns":[')
+    first = True
+    async for docs in batches:
+        for d in docs:
+            d = _row(d)
+            if fmt == 'csv':
+                writer.writerow(d)
+            elif fmt == 'jsonl':
+                out.write(json.dumps(d, ensure_ascii=False, sort_keys=True, separators=(',', ':'))+'\n')
+            else:
+                out.write(('' if first else ',\n')+json.dumps(d, ensure_ascii=False, sort_keys=True, separators=(',', ':')))
+            first = False
+    if fmt == 'json':
+        out.write(']}')
+    out.flush()
+    out.detach() # leave the underlying buffers open
+    if compress:
+        sink.close() # writes the gzip trailer, raw stays open
+    raw.seek(0)
+    return raw
+
+def filename(userid: str, fmt: str, compress: bool) -> str:
+    return f'{userid}.{fmt}'+('.gz' if compress else '')
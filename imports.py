@@ -0,0 +1,55 @@
+'''parsers for exchange csv exports. each parser takes csv rows (dicts with lower-cased headers)
+and a `resolve(symbol) -> coin id or None`, and returns (txns, skipped rows)'''
+import csv
+import io
+
+def parse_coinbase(rows, resolve) -> tuple:
+    '''coinbase (pro) account statements: every order has usd match rows, coin match rows and a usd fee row.
+    deposits and withdrawals have no order id and are skipped, and so are orders without a usd leg
+    or with more than one coin (e.g. ETH-BTC), since they have no usd price'''
+    orders = {}
+    skipped = 0
+    for c in rows:
+        uid = c.get('order id')
+        if not uid:
+            skipped += 1
+            continue
+        d = orders.get(uid)
+        if d is None:
+            d = orders[uid] = {'cborderid':uid, 'usd':None, 'units':{}, 'date':None}
+        amount = float(c.get('amount') or 0)
+        unit = c.get('amount/balance unit')
+        if unit == 'USD':
+            d['usd'] = (d['usd'] or 0.0) + amount #match and fee rows alike, so fees count toward the price
+        else:
+            d['units'][unit] = d['units'].get(unit, 0.0) + amount
+        d['date'] = (c.get('time') or '')[:10] #2021-11-05T17:38:42.123Z
+    txns = []
+    resolved = {} #a history only has a handful of distinct units
+    for d in orders.values():
+        if d.get('usd') is None or len(d.get('units')) != 1:
+            skipped += 1
+            continue
+        (unit, amount), = d.get('units').items()
+        if unit not in resolved:
+            resolved[unit] = resolve(unit) if unit else None
+        coin = resolved.get(unit)
+        if coin is None:
+            skipped += 1
+            continue
+        # buys: usd is negative and amount positive, sales the other way round; price is usd paid like !buy
+        txns.append({'cborderid':d.get('cborderid'), 'amount':amount, 'currency':coin,
+            'price':-d.get('usd'), 'date':d.get('date')})
+    return txns, skipped
+
+PARSERS = {'coinbase': parse_coinbase}
+
+def read_rows(data: bytes):
+    '''csv rows from raw attachment bytes, headers lower-cased and stripped'''
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline=''))
+    header = [h.strip().lower() for h in next(reader, [])]
+    for row in reader:
+        yield dict(zip(header, row))
+
+def parse(data: bytes, source: str, resolve) -> tuple:
+    return PARSERS[source](read_rows(data), resolve)
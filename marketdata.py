@@ -0,0 +1,82 @@
+'''local price history for /market_chart, stored in mongo and topped up incrementally.
+a series is a list of [unix ms, usd price] pairs keyed by coin and resolution'''
+import asyncio
+import datetime as dt
+import logging
+import math
+import time
+from coingecko import CoinGeckoError
+import metrics
+
+log = logging.getLogger(__name__)
+
+DAY = 86400
+HOURLY_SPAN = 90 # coingecko serves hourly points for 2-90 days
+
+def resolution(days) -> str:
+    return 'daily' if int(days) >= 30 else 'hourly'
+
+def merge(old: list, new: list) -> list:
+    '''replace everything in `old` from the first timestamp of `new` onwards'''
+    if not new:
+        return old
+    cut = new[0][0]
+    return [p for p in old if p[0] < cut] + new
+
+def window(prices: list, days, res: str) -> list:
+    '''slice the last `days` out of a stored series the way /market_chart?days= would'''
+    if res == 'daily':
+        expectedDate = (dt.datetime.today() - dt.timedelta(days=int(days))).strftime('%Y-%m-%d')
+        return [p for p in prices if dt.datetime.utcfromtimestamp(p[0]/1000).strftime('%Y-%m-%d') >= expectedDate]
+    cutoff = (time.time() - int(days)*DAY)*1000
+    return [p for p in prices if p[0] >= cutoff]
+
+class MarketSeries:
+    '''serves price series from the `market_chart` collection, fetching only the missing tail
+    once the stored copy is older than `fresh` seconds'''
+    def __init__(self, store, cg, fresh=300):
+        self.store = store
+        self.cg = cg
+        self.fresh = fresh
+
+    async def _fetch(self, coin: str, res: str, days) -> list:
+        p = {'vs_currency':'usd', 'days':days}
+        if res == 'daily':
+            p['interval'] = 'daily'
+        data = await self.cg.get('/coins/'+coin+'/market_chart', params=p)
+        return [[int(t), v] for t,v in data.get('prices')]
+
+    async def prices(self, coin: str, res: str) -> list:
+        now = time.time()
+        doc = await self.store.get_series(coin, res)
+        metrics.cache('market_series', doc is not None and bool(doc.get('prices')) and now - doc.get('updated') <= self.fresh)
+        if doc is None or not doc.get('prices'):
+            prices = await self._fetch(coin, res, 'max' if res == 'daily' else HOURLY_SPAN)
+        elif now - doc.get('updated') > self.fresh:
+            tail = math.ceil((now - doc.get('prices')[-1][0]/1000)/DAY) + 1
+            if res == 'hourly':
+                # past HOURLY_SPAN coingecko answers in daily points; a stored copy that old is
+                # all cut below anyway, so this amounts to refetching the full hourly span
+                tail = min(max(tail, 2), HOURLY_SPAN)
+            try:
+                new = await self._fetch(coin, res, tail)
+            except CoinGeckoError as e:
+                log.warning('serving stale series', extra={'coin':coin, 'resolution':res, 'error':str(e)})
+                return doc.get('prices')
+            prices = merge(doc.get('prices'), new)
+        else:
+            return doc.get('prices')
+        if res == 'hourly':
+            prices = [p for p in prices if p[0] >= (now - HOURLY_SPAN*DAY)*1000]
+        await self.store.put_series(coin, res, prices, now)
+        return prices
+
+    async def window(self, coin: str, days) -> list:
+        res = resolution(days)
+        return window(await self.prices(coin, res), days, res)
+
+    async def windows(self, coins: list, days) -> dict:
+        '''batch version of window(); all coins are fetched concurrently'''
+        coins = list(coins)
+        series = await asyncio.gather(*[self.window(c, days) for c in coins])
+        return dict(zip(coins, series))
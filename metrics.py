@@ -0,0 +1,138 @@
+'''prometheus-style metrics for commands and outbound calls (coingecko, chart server, mongo),
+served as text on a local /metrics endpoint, plus json-lines logging'''
+import json
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from aiohttp import web
+
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+
+def _labels(names, values) -> str:
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"')) for n,v in zip(names, values))
+    return '{'+pairs+'}'
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = {}
+
+    def inc(self, *labels, amount: float=1):
+        self.values[labels] = self.values.get(labels, 0)+amount
+
+    def expose(self) -> list:
+        out = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        out += [f'{self.name}{_labels(self.labels, k)} {v}' for k,v in self.values.items()]
+        return out
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        self.values = {} # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *labels):
+        v = self.values.get(labels)
+        if v is None:
+            v = self.values[labels] = [0]*(len(self.buckets)+2)
+        i = bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            v[i] += 1
+        v[-2] += value
+        v[-1] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        '''observe how long the block takes; works around awaits too'''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter()-start, *labels)
+
+    def expose(self) -> list:
+        out = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for k,v in self.values.items():
+            cumulative = 0
+            for le,n in zip(self.buckets, v):
+                cumulative += n
+                out.append(f'{self.name}_bucket{_labels(self.labels+("le",), k+(le,))} {cumulative}')
+            out.append(f'{self.name}_bucket{_labels(self.labels+("le",), k+("+Inf",))} {v[-1]}')
+            out.append(f'{self.name}_sum{_labels(self.labels, k)} {v[-2]}')
+            out.append(f'{self.name}_count{_labels(self.labels, k)} {v[-1]}')
+        return out
+
+class Gauge:
+    '''value read at scrape time from `fn`, which returns {label values tuple: value}'''
+    def __init__(self, name: str, help: str, fn, labels=()):
+        self.name, self.help, self.fn, self.labels = name, help, fn, tuple(labels)
+
+    def expose(self) -> list:
+        out = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        out += [f'{self.name}{_labels(self.labels, k)} {v}' for k,v in self.fn().items()]
+        return out
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs) -> Counter:
+        return self.register(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        return self.register(Histogram(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        return self.register(Gauge(*args, **kwargs))
+
+    def expose(self) -> str:
+        lines = []
+        for m in self.metrics:
+            lines += m.expose()
+        return '\n'.join(lines)+'\n'
+
+REGISTRY = Registry()
+COMMANDS = REGISTRY.histogram('discoin_command_seconds', 'bot command latency', ['command'])
+COMMAND_ERRORS = REGISTRY.counter('discoin_command_errors_total', 'bot commands that raised', ['command', 'error'])
+UPSTREAM = REGISTRY.histogram('discoin_upstream_seconds', 'outbound call latency', ['service', 'op'])
+UPSTREAM_ERRORS = REGISTRY.counter('discoin_upstream_errors_total', 'failed outbound calls', ['service', 'op'])
+CACHE = REGISTRY.counter('discoin_cache_requests_total', 'cache lookups by result (hit/miss)', ['cache', 'result'])
+
+def cache(name: str, hit: bool):
+    CACHE.inc(name, 'hit' if hit else 'miss')
+
+async def serve(host: str='127.0.0.1', port: int=9108):
+    '''start the /metrics http server on the running loop, returns the runner'''
+    async def handler(request):
+        return web.Response(text=REGISTRY.expose(), content_type='text/plain')
+    app = web.Application()
+    app.router.add_get('/metrics', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.getLogger(__name__).info('metrics listening', extra={'host':host, 'port':port})
+    return runner
+
+_STANDARD = set(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    '''one json object per line: ts, level, logger, msg and anything passed in extra={}'''
+    def format(self, record) -> str:
+        d = {'ts':self.formatTime(record), 'level':record.levelname, 'logger':record.name, 'msg':record.getMessage()}
+        d.update({k:v for k,v in record.__dict__.items() if k not in _STANDARD})
+        if record.exc_info:
+            d['exc'] = self.formatException(record.exc_info)
+        return json.dumps(d, default=str)
+
+def setup_logging(level=logging.INFO):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
@@ -0,0 +1,81 @@
+'''portfolio math. orders are grouped per coin in a single pass, then priced'''
+
+def positions(orders) -> dict:
+    '''totals per coin from one pass over a user's orders.
+    buys (incl. mining) have price >= 0, sales have negative price and amount'''
+    pos = {}
+    for x in orders:
+        coin = x.get('currency')
+        price = x.get('price')
+        amount = x.get('amount')
+        p = pos.get(coin)
+        if p is None:
+            p = pos[coin] = {'amount':0, 'spent':0, 'bought':0, 'proceeds':0, 'sold':0}
+        p['amount'] += amount
+        if price >= 0:
+            p['spent'] += price
+            p['bought'] += amount
+        else:
+            p['proceeds'] -= price
+            p['sold'] -= amount
+    return pos
+
+def position_delta(txn: dict, sign: int=1) -> dict:
+    '''$inc for one txn's effect on its position; sign=-1 undoes it'''
+    price = txn.get('price')
+    amount = txn.get('amount')
+    d = {'amount':amount, 'txns':1, 'spent':0, 'bought':0, 'proceeds':0, 'sold':0}
+    if price >= 0:
+        d['spent'] = price
+        d['bought'] = amount
+    else:
+        d['proceeds'] = -price
+        d['sold'] = -amount
+    return {k:sign*v for k,v in d.items()}
+
+def coin_stats(coin: str, p: dict, coinUSD: float, change24h: float=None) -> dict:
+    '''per-coin line of the portfolio from its position totals.
+    coinUSD is None when there's no price yet; the coin then counts as worth 0'''
+    buyAvg = p.get('spent')/p.get('bought') if p.get('bought') else 0
+    saleAvg = p.get('proceeds')/p.get('sold') if p.get('sold') else 0
+    d = {
+        'coin': coin,
+        'coinUSD': coinUSD,
+        'change24h': change24h,
+        'coinOwned': p.get('amount'),
+        'usdSpent': p.get('spent'), #doesnt account for mining
+        'avgPurchasePrice': buyAvg,
+        'usdProfit': p.get('proceeds'),
+        'avgProfitPrice': saleAvg,
+        'priced': coinUSD is not None,
+    }
+    d['coinValue'] = d.get('coinOwned')*coinUSD if coinUSD is not None else 0
+    if d.get('coinValue') > 0 and buyAvg:
+        d['gainLoss'] = (coinUSD - buyAvg)/buyAvg*100
+    else:
+        d['gainLoss'] = 0
+    return d
+
+def stats(pos: dict, coinval: dict, realized: dict=None) -> dict:
+    '''summary + coinStats for a set of positions, priced with `coinval` ({coin: {'usd': price}}).
+    `realized` is an optional tax.summary() whose gains are added per coin and overall'''
+    coinStats = [coin_stats(coin, p, (coinval.get(coin) or {}).get('usd'), (coinval.get(coin) or {}).get('usd_24h_change'))
+        for coin,p in pos.items()]
+    if realized is not None:
+        for c in coinStats:
+            gains = realized.get('coins').get(c.get('coin'), {})
+            c['realizedGain'] = gains.get('short', 0) + gains.get('long', 0)
+    totalSpent = sum(c.get('usdSpent') for c in coinStats)
+    totalValue = sum(c.get('coinValue') for c in coinStats)
+    totalProfit = sum(c.get('usdProfit') for c in coinStats)
+    return {
+        'summary':
+            {'totalValue': totalValue,
+            'totalSpent': totalSpent,
+            'totalGain': totalValue-totalSpent,
+            'totalProfit': totalProfit,
+            'roi': (totalValue-(totalSpent-totalProfit))/(totalSpent-totalProfit),
+            'invested': totalSpent-totalProfit,
+            'realizedGain': None if realized is None else realized.get('total').get('short') + realized.get('total').get('long'),
+            },
+        'coinStats':coinStats}
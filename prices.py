@@ -0,0 +1,33 @@
+'''in-memory copy of coin_latest, swapped in whole by the Scheduler after each refresh'''
+import datetime as dt
+from collections import namedtuple
+
+Snapshot = namedtuple('Snapshot', ['prices', 'version', 'updated'])
+
+def from_market(row: dict, vs: str='usd') -> dict:
+    '''a /coins/markets row in the /simple/price shape coin_latest uses: {'usd': .., 'usd_24h_change': ..}'''
+    return {vs: row.get('current_price'),
+        f'{vs}_24h_change': row.get('price_change_percentage_24h'),
+        f'{vs}_market_cap': row.get('market_cap')}
+
+class PriceCache:
+    '''readers take `snapshot()` once and use it for the whole command;
+    writers build a new dict and swap it in, so nobody sees a half-written refresh'''
+    def __init__(self):
+        self._snapshot = Snapshot({}, 0, None)
+
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+
+    def swap(self, prices: dict):
+        '''replace every price, e.g. after update_coinvals'''
+        self._snapshot = Snapshot(dict(prices), self._snapshot.version+1, dt.datetime.utcnow())
+
+    def merge(self, prices: dict):
+        '''add prices for coins the snapshot doesn't have yet, e.g. loaded from coin_latest at startup'''
+        current = self._snapshot
+        self._snapshot = Snapshot({**current.prices, **prices}, current.version, current.updated)
+
+    def missing(self, coins) -> list:
+        prices = self._snapshot.prices
+        return [c for c in coins if c not in prices]
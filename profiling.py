@@ -0,0 +1,112 @@
+'''per-command profiling. every command gets a span tree (mongo, coingecko, chart and cpu spans nest under it);
+sampled commands also run under cProfile. commands slower than `threshold` seconds are dumped to `out` as
+folded stacks (flamegraph.pl, speedscope) and, when sampled, a .prof file (pstats, snakeviz)'''
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+_current = contextvars.ContextVar('span', default=None) # asyncio tasks copy it, so gather()ed calls nest too
+
+class Span:
+    __slots__ = ('name', 'start', 'end', 'children')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter())-self.start
+
+    def folded(self, prefix: str='') -> list:
+        '''folded stack lines (`root;child;leaf microseconds`) of self time.
+        concurrent children can add up to more than their parent, so self time bottoms out at 0'''
+        stack = f'{prefix};{self.name}' if prefix else self.name
+        own = self.duration-sum(c.duration for c in self.children)
+        lines = [f'{stack} {max(int(own*1e6), 0)}']
+        for c in self.children:
+            lines += c.folded(stack)
+        return lines
+
+    def tree(self, depth: int=0) -> list:
+        lines = [f'{"  "*depth}{self.name} {self.duration*1000:.1f}ms']
+        for c in self.children:
+            lines += c.tree(depth+1)
+        return lines
+
+@contextmanager
+def span(name: str):
+    '''time the block as a child of the current span; does nothing outside a command'''
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    s = Span(name)
+    parent.children.append(s)
+    token = _current.set(s)
+    try:
+        yield s
+    finally:
+        s.end = time.perf_counter()
+        _current.reset(token)
+
+class Profiler:
+    '''start()/finish() wrap one command (the bot's before/after invoke hooks).
+    `sample` is the fraction of commands run under cProfile; only one at a time since the
+    profiler sees the whole event loop, not just the command'''
+    def __init__(self, threshold: float=2, sample: float=0, out: str='profiles', keep: int=50):
+        self.threshold = threshold
+        self.sample = sample
+        self.out = out
+        self.keep = keep
+        self.slow = 0
+        self._active = None
+
+    def start(self, ctx):
+        ctx.span = Span(ctx.command.qualified_name)
+        ctx.span_token = _current.set(ctx.span)
+        ctx.cprofile = None
+        if self.sample and self._active is None and random.random() < self.sample:
+            ctx.cprofile = self._active = cProfile.Profile()
+            ctx.cprofile.enable()
+
+    def finish(self, ctx) -> str:
+        '''close the command's span; returns the dump path (without extension) if it was slow'''
+        root = ctx.span
+        root.end = time.perf_counter()
+        _current.reset(ctx.span_token)
+        if ctx.cprofile is not None:
+            ctx.cprofile.disable()
+            self._active = None
+        if root.duration < self.threshold:
+            return None
+        self.slow += 1
+        return self.dump(root, ctx.cprofile)
+
+    def dump(self, root: Span, prof: cProfile.Profile=None) -> str:
+        os.makedirs(self.out, exist_ok=True)
+        base = os.path.join(self.out, f'{root.name.replace(" ", "_")}-{int(time.time()*1000)}')
+        with open(base+'.folded', 'w') as f:
+            f.write('\n'.join(root.folded())+'\n')
+        if prof is not None:
+            prof.dump_stats(base+'.prof')
+        self._prune()
+        log.warning('slow command', extra={'command':root.name, 'ms':round(root.duration*1000),
+            'trace':base, 'spans':'\n'.join(root.tree())})
+        return base
+
+    def _prune(self):
+        '''keep the newest `keep` dumps'''
+        files = os.listdir(self.out)
+        bases = sorted({os.path.splitext(f)[0] for f in files}, key=lambda b: int(b.rsplit('-', 1)[-1]))
+        old = set(bases[:-self.keep])
+        for f in files:
+            if os.path.splitext(f)[0] in old:
+                os.remove(os.path.join(self.out, f))
@@ -0,0 +1,72 @@
+'''bookkeeping for the Scheduler's loops: run history, overlap guard, jitter, and the adaptive price interval'''
+import asyncio
+import logging
+import math
+import random
+import time
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+class Job:
+    '''wraps one scheduled task. records duration and outcome of each run, skips a run if the
+    previous one is still going, and sleeps up to `jitter` seconds first (not on the first run)'''
+    def __init__(self, name: str, jitter: float=0, history: int=50):
+        self.name = name
+        self.jitter = jitter
+        self.runs = deque(maxlen=history)
+        self.running = False
+        self.skipped = 0
+
+    async def __call__(self, fn, *args, **kwargs):
+        if self.running:
+            self.skipped += 1
+            log.warning('job still running, skipped', extra={'job':self.name})
+            return None
+        self.running = True
+        try:
+            if self.jitter and self.runs:
+                await asyncio.sleep(random.uniform(0, self.jitter))
+            start = time.monotonic()
+            outcome = 'ok'
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e: # an unhandled error would stop the tasks.loop for good
+                outcome = f'error: {e!r}'
+                log.exception('job failed', extra={'job':self.name})
+            finally:
+                self.runs.append({'at':time.time(), 'duration':time.monotonic()-start, 'outcome':outcome})
+        finally:
+            self.running = False
+
+    def stats(self) -> dict:
+        durations = [r.get('duration') for r in self.runs]
+        return {'name':self.name, 'runs':len(self.runs), 'skipped':self.skipped,
+            'errors':len([r for r in self.runs if r.get('outcome') != 'ok']),
+            'avg':sum(durations)/len(durations) if durations else 0,
+            'max':max(durations) if durations else 0,
+            'last':self.runs[-1] if self.runs else None}
+
+class Activity:
+    '''when a command last ran, so idle hours can refresh less'''
+    def __init__(self):
+        self.last = time.monotonic()
+
+    def mark(self):
+        self.last = time.monotonic()
+
+    def idle_for(self) -> float:
+        return time.monotonic()-self.last
+
+def price_interval(idle: float, coins: int, watching: bool, rate_per_min: float,
+        share: float=0.3, busy: float=600, idle_after: float=3600,
+        fastest: float=1, default: float=5, slowest: float=60) -> float:
+    '''minutes until the next price refresh.
+    busy (a command in the last `busy` seconds): as often as `share` of the api budget allows, but not under `fastest`.
+    idle for `idle_after` seconds with no alerts to check: `slowest`. otherwise `default`'''
+    if idle >= idle_after and not watching:
+        return slowest
+    if idle < busy:
+        calls = max(math.ceil(coins/250), 1) # /coins/markets calls per refresh
+        return min(max(calls/(rate_per_min*share), fastest), default)
+    return default
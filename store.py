@@ -0,0 +1,370 @@
+'''async data access for the bot's mongo collections.
+pymongo calls run on a bounded thread pool so they never block the gateway heartbeat'''
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from portfolio import position_delta
+import metrics
+import profiling
+
+log = logging.getLogger(__name__)
+
+TXN_FIELDS = {'price':1, 'amount':1, 'currency':1, 'date':1} #what !txns shows
+
+def plan_stages(plan: dict):
+    '''every stage name in an explain() plan tree'''
+    yield plan.get('stage')
+    for key in ('inputStage', 'outerStage', 'innerStage'):
+        if key in plan:
+            yield from plan_stages(plan.get(key))
+    for child in plan.get('inputStages', []):
+        yield from plan_stages(child)
+
+def op_name(fn) -> str:
+    '''metric label for a call passed to run(): Store.user_txns.<locals>.<lambda> -> user_txns, Collection.find_one -> find_one'''
+    name = getattr(fn, '__qualname__', None) or getattr(fn, '__name__', type(fn).__name__)
+    return name.split('.<locals>')[0].rsplit('.', 1)[-1]
+
+class Store:
+    def __init__(self, client, workers=8):
+        self.client = client
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mongo')
+        self.on_write = [] #callbacks(userid) run after a user's txns change, e.g. cache invalidation
+
+    def _wrote(self, userid: str):
+        for fn in self.on_write:
+            fn(userid)
+
+    async def run(self, fn, *args, **kwargs):
+        '''run a blocking pymongo call on the pool'''
+        loop = asyncio.get_event_loop()
+        op = op_name(fn)
+        start = time.perf_counter()
+        try:
+            with profiling.span('mongo '+op):
+                return await loop.run_in_executor(self.pool, partial(fn, *args, **kwargs))
+        except Exception:
+            metrics.UPSTREAM_ERRORS.inc('mongo', op)
+            raise
+        finally:
+            metrics.UPSTREAM.observe(time.perf_counter()-start, 'mongo', op)
+
+    @property
+    def txns(self):
+        return self.client.txns.txns
+
+    @property
+    def coin_latest(self):
+        return self.client.coin_latest.coin_latest
+
+    @property
+    def coinref(self):
+        return self.client.coinref.coinref
+
+    @property
+    def market_chart(self):
+        return self.client.market_chart.market_chart
+
+    @property
+    def positions(self):
+        return self.client.txns.positions
+
+    @property
+    def watchers(self):
+        return self.client.watchers.watchers
+
+    @property
+    def blocked(self):
+        return self.client.blocked.blocked
+
+    # startup
+    def indexes(self) -> list:
+        '''(collection, keys, options) for every index the hot queries need'''
+        return [
+            (self.txns, [('userid', ASCENDING), ('_id', ASCENDING)], {}),
+            (self.txns, [('userid', ASCENDING), ('currency', ASCENDING), ('_id', ASCENDING)], {}),
+            (self.txns, [('currency', ASCENDING)], {}),
+            (self.txns, [('userid', ASCENDING), ('cborderid', ASCENDING)],
+                {'unique':True, 'partialFilterExpression':{'cborderid':{'$exists':True}}}), #import idempotency
+            (self.positions, [('userid', ASCENDING), ('currency', ASCENDING)], {'unique':True}),
+            (self.coin_latest, [('currency', ASCENDING)], {}),
+            (self.coinref, [('id', ASCENDING)], {}),
+            (self.coinref, [('symbol', ASCENDING)], {}),
+            (self.coinref, [('symbol', TEXT), ('name', TEXT), ('id', TEXT)], {'weights':{'symbol':10, 'name':5, 'id':1}}),
+            (self.market_chart, [('coin', ASCENDING), ('resolution', ASCENDING)], {'unique':True}),
+            (self.blocked, [('userid', ASCENDING), ('type', ASCENDING)], {}),
+            (self.watchers, [('userid', ASCENDING)], {}),
+            (self.watchers, [('expires', ASCENDING)], {'expireAfterSeconds':0}), #mongo drops expired alerts too
+            ]
+
+    def hot_queries(self) -> list:
+        '''(collection, filter) samples of the queries run on every command'''
+        return [
+            (self.txns, {'userid':'0'}),
+            (self.txns, {'userid':'0', 'currency':'bitcoin'}),
+            (self.positions, {'userid':'0'}),
+            (self.coinref, {'id':'bitcoin'}),
+            (self.coinref, {'$text':{'$search':'btc'}}),
+            (self.coin_latest, {'currency':{'$in':['bitcoin']}}),
+            (self.market_chart, {'coin':'bitcoin', 'resolution':'daily'}),
+            (self.blocked, {'userid':'0', 'type':'flex'}),
+            ]
+
+    async def ensure_indexes(self):
+        '''create any missing index; existing ones are left alone'''
+        def _ensure():
+            for coll, keys, options in self.indexes():
+                try:
+                    coll.create_index(keys, background=True, **options)
+                except OperationFailure as e:
+                    # e.g. a text index already exists with different fields
+                    log.warning('index not created', extra={'collection':coll.full_name, 'keys':keys, 'error':str(e)})
+        await self.run(_ensure)
+
+    async def audit_queries(self) -> list:
+        '''explain() every hot query and warn about collection scans. returns the ones that scan'''
+        def _audit():
+            scans = []
+            for coll, q in self.hot_queries():
+                try:
+                    plan = coll.find(q).explain().get('queryPlanner', {}).get('winningPlan', {})
+                except OperationFailure as e:
+                    log.warning('explain failed', extra={'collection':coll.full_name, 'query':q, 'error':str(e)})
+                    continue
+                plan = plan.get('queryPlan', plan) #slot based engine (5.1+) nests the stage tree one level down
+                if 'COLLSCAN' in plan_stages(plan):
+                    log.warning('collection scan', extra={'collection':coll.full_name, 'query':q})
+                    scans.append((coll.full_name, q))
+            return scans
+        return await self.run(_audit)
+
+    # txns
+    async def user_txns(self, userid: str, coin: str=None) -> list:
+        searchTerms = {'userid':userid}
+        if coin:
+            searchTerms['currency'] = coin
+        return await self.run(lambda: list(self.txns.find(searchTerms)))
+
+    async def iter_txns(self, userid: str, coin: str=None, batch: int=200, projection: dict=TXN_FIELDS):
+        '''yields a user's txns in _id order, `batch` at a time, each batch its own range query on _id'''
+        searchTerms = {'userid':userid}
+        if coin:
+            searchTerms['currency'] = coin
+        after = None
+        while True:
+            q = dict(searchTerms, _id={'$gt':after}) if after else searchTerms
+            docs = await self.run(lambda: list(self.txns.find(q, projection).sort('_id', ASCENDING).limit(batch)))
+            if docs:
+                yield docs
+            if len(docs) < batch:
+                return
+            after = docs[-1].get('_id')
+
+    async def txn_page(self, userid: str, coin: str=None, page: int=1, size: int=20, projection: dict=TXN_FIELDS):
+        '''returns (txns on that page, whether there's a next page)'''
+        searchTerms = {'userid':userid}
+        if coin:
+            searchTerms['currency'] = coin
+        def _page():
+            # walk the index for the page's first _id, then range query from it
+            first = list(self.txns.find(searchTerms, {'_id':1}).sort('_id', ASCENDING).skip((page-1)*size).limit(1))
+            if not first:
+                return [], False
+            q = dict(searchTerms, _id={'$gte':first[0].get('_id')})
+            docs = list(self.txns.find(q, projection).sort('_id', ASCENDING).limit(size+1))
+            return docs[:size], len(docs) > size
+        return await self.run(_page)
+
+    async def add_txn(self, txn: dict):
+        def _add():
+            r = self.txns.insert_one(txn)
+            self._inc_position(txn, 1)
+            return r
+        r = await self.run(_add)
+        self._wrote(txn.get('userid'))
+        return r
+
+    async def import_txns(self, userid: str, txns: list) -> dict:
+        '''insert imported txns in one unordered insert_many. rows already imported
+        (same userid + cborderid) are rejected by the unique index and counted as duplicates'''
+        for t in txns:
+            t['userid'] = userid
+        def _import():
+            if not txns:
+                return {'inserted':0, 'duplicates':0}
+            try:
+                inserted = len(self.txns.insert_many(txns, ordered=False).inserted_ids)
+                dupes = 0
+            except BulkWriteError as e:
+                inserted = e.details.get('nInserted')
+                dupes = len([x for x in e.details.get('writeErrors') if x.get('code') == 11000])
+                if dupes != len(e.details.get('writeErrors')):
+                    raise
+            return {'inserted':inserted, 'duplicates':dupes}
+        counts = await self.run(_import)
+        if counts.get('inserted'):
+            await self.rebuild_positions(userid)
+            self._wrote(userid)
+        return counts
+
+    async def delete_txn(self, userid: str, txnid: str) -> int:
+        def _delete():
+            txn = self.txns.find_one_and_delete({'_id':ObjectId(txnid), 'userid':userid})
+            if txn:
+                self._inc_position(txn, -1)
+            return 1 if txn else 0
+        deleted = await self.run(_delete)
+        if deleted:
+            self._wrote(userid)
+        return deleted
+
+    async def wipe_user(self, userid: str) -> int:
+        '''delete every txn for a user, returns how many are left (should be 0)'''
+        await self.run(self.txns.delete_many, {'userid':userid})
+        await self.run(self.positions.delete_many, {'userid':userid})
+        self._wrote(userid)
+        return await self.run(self.txns.count_documents, {'userid':userid})
+
+    async def tracked_currencies(self) -> list:
+        '''every currency anyone holds a txn in; uses the currency index instead of scanning txns'''
+        return await self.run(self.txns.distinct, 'currency')
+
+    # positions, per user per coin totals kept in step with txns
+    def _inc_position(self, txn: dict, sign: int):
+        key = {'userid':txn.get('userid'), 'currency':txn.get('currency')}
+        self.positions.update_one(key, {'$inc':position_delta(txn, sign)}, upsert=True)
+        if sign < 0:
+            # last txn for this coin is gone, don't leave a zeroed position behind
+            self.positions.delete_one({**key, 'txns':{'$lte':0}})
+
+    async def user_positions(self, userid: str) -> dict:
+        '''{currency: totals} for a user'''
+        pos = await self.run(lambda: list(self.positions.find({'userid':userid}, {'_id':0, 'userid':0})))
+        return {p.pop('currency'):p for p in pos}
+
+    async def ensure_positions(self):
+        '''build positions from txns if they've never been built, e.g. first start after upgrading'''
+        if not await self.run(self.positions.find_one) and await self.run(self.txns.find_one):
+            await self.rebuild_positions()
+            log.info('positions rebuilt from txns')
+
+    async def rebuild_positions(self, userid: str=None) -> dict:
+        '''regenerate positions from txns for one user, or everyone (one user at a time) if userid is None.
+        positions are replaced in place, never emptied first, so !coin keeps working during a rebuild.
+        returns the user's positions (empty when rebuilding everyone)'''
+        if userid:
+            return await self.run(self._rebuild_user, userid)
+        users = set(await self.run(self.txns.distinct, 'userid'))
+        users |= set(await self.run(self.positions.distinct, 'userid')) #leftovers from users with no txns
+        for u in users:
+            await self.run(self._rebuild_user, u)
+        return {}
+
+    def _rebuild_user(self, userid: str) -> dict:
+        buy = {'$gte':['$price', 0]}
+        pipeline = [{'$match':{'userid':userid}}, {'$group':{
+            '_id':'$currency',
+            'amount':{'$sum':'$amount'},
+            'txns':{'$sum':1},
+            'spent':{'$sum':{'$cond':[buy, '$price', 0]}},
+            'bought':{'$sum':{'$cond':[buy, '$amount', 0]}},
+            'proceeds':{'$sum':{'$cond':[buy, 0, {'$multiply':['$price', -1]}]}},
+            'sold':{'$sum':{'$cond':[buy, 0, {'$multiply':['$amount', -1]}]}},
+            }}]
+        pos = {}
+        for x in self.txns.aggregate(pipeline):
+            x['currency'] = x.pop('_id')
+            x['userid'] = userid
+            pos[x.get('currency')] = x
+        ops = [ReplaceOne({'userid':userid, 'currency':c}, x, upsert=True) for c,x in pos.items()]
+        ops.append(DeleteMany({'userid':userid, 'currency':{'$nin':list(pos)}})) #coins with no txns left
+        self.positions.bulk_write(ops, ordered=False)
+        return pos
+
+    # coin_latest
+    async def latest(self, coins: list) -> list:
+        return await self.run(lambda: list(self.coin_latest.find({'currency':{'$in':list(coins)}})))
+
+    async def upsert_latest(self, coinvals: list, tracked: list=None):
+        '''upsert prices in place so readers never see an empty collection.
+        if `tracked` is given, prices for coins nobody holds any more are dropped'''
+        ops = [UpdateOne({'currency':x.get('currency')}, {'$set':x}, upsert=True) for x in coinvals]
+        if tracked is not None:
+            ops.append(DeleteMany({'currency':{'$nin':list(tracked)}}))
+        if ops:
+            await self.run(self.coin_latest.bulk_write, ops, ordered=False)
+
+    # coinref
+    async def find_coin(self, coin: str, key: str='id') -> list:
+        return await self.run(lambda: list(self.coinref.find({key:coin})))
+
+    async def search_coins(self, keyword: str) -> list:
+        return await self.run(lambda: list(self.coinref.find({'$text':{'$search':keyword}},{'_id':0})))
+
+    async def all_coins(self) -> list:
+        return await self.run(lambda: list(self.coinref.find({}, {'_id':0})))
+
+    async def sync_coinref(self, coins: list) -> dict:
+        '''bring coinref in line with a fresh /coins/list by writing only what changed.
+        coins are never missing mid-refresh, and the text index only updates changed docs'''
+        fields = ('id', 'symbol', 'name')
+        def _sync():
+            stored = {x.get('id'):x for x in self.coinref.find({}, {'_id':0})}
+            fresh = {c.get('id'):{f:c.get(f) for f in fields} for c in coins}
+            ops = []
+            counts = {'inserted':0, 'updated':0, 'removed':0}
+            for cid,c in fresh.items():
+                old = stored.get(cid)
+                if old is None:
+                    ops.append(InsertOne(dict(c)))
+                    counts['inserted'] += 1
+                elif any(old.get(f) != c.get(f) for f in fields):
+                    ops.append(UpdateOne({'id':cid}, {'$set':c}))
+                    counts['updated'] += 1
+            if fresh: # an empty list is coingecko misbehaving, not every coin delisting
+                for cid in stored.keys() - fresh.keys():
+                    ops.append(DeleteOne({'id':cid}))
+                    counts['removed'] += 1
+            if ops:
+                self.coinref.bulk_write(ops, ordered=False)
+            return counts
+        return await self.run(_sync)
+
+    # market_chart
+    async def get_series(self, coin: str, res: str) -> dict:
+        return await self.run(self.market_chart.find_one, {'coin':coin, 'resolution':res})
+
+    async def put_series(self, coin: str, res: str, prices: list, updated: float):
+        await self.run(self.market_chart.update_one, {'coin':coin, 'resolution':res},
+            {'$set':{'prices':prices, 'updated':updated}}, upsert=True)
+
+    # watchers
+    async def all_watchers(self) -> list:
+        return await self.run(lambda: list(self.watchers.find()))
+
+    async def count_watchers(self, userid: str) -> int:
+        return await self.run(self.watchers.count_documents, {'userid':userid})
+
+    async def add_watcher(self, alert: dict):
+        await self.run(self.watchers.insert_one, alert)
+
+    async def delete_watchers(self, ids: list):
+        await self.run(self.watchers.delete_many, {'_id':{'$in':[ObjectId(x) for x in ids]}})
+
+    async def delete_user_watchers(self, userid: str):
+        await self.run(self.watchers.delete_many, {'userid':userid})
+
+    # blocked
+    async def is_blocked(self, user: str, type: str) -> bool:
+        return bool(await self.run(self.blocked.find_one, {'userid':user, 'type':type}))
+
+    async def block(self, user: str, type: str):
+        await self.run(self.blocked.insert_one, {'user':user, 'type':type})
+
+    async def unblock(self, user: str, type: str):
+        await self.run(self.blocked.delete_one, {'user':user, 'type':type})
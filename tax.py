@@ -0,0 +1,126 @@
+'''cost basis: matches each sale against earlier buys (lots) and reports realized gains per sale.
+FIFO uses a deque, LIFO a stack and HIFO a heap of unit costs, so a history is O(n log n)'''
+import datetime as dt
+import heapq
+from collections import OrderedDict, deque
+
+METHODS = ('fifo', 'lifo', 'hifo')
+LONG_TERM = 365 #days held before a gain is long term
+
+def _date(s):
+    try:
+        return dt.date.fromisoformat(str(s)[:10])
+    except ValueError:
+        return None
+
+class Lots:
+    '''open lots for one coin; each lot is [unit cost, date, amount left]'''
+    def __init__(self, method: str):
+        self.method = method
+        self.lots = [] if method == 'hifo' else deque()
+        self.n = 0 # tiebreak so the heap never compares dates
+
+    def add(self, unit: float, date, amount: float):
+        if self.method == 'hifo':
+            heapq.heappush(self.lots, (-unit, self.n, [unit, date, amount]))
+            self.n += 1
+        else:
+            self.lots.append([unit, date, amount])
+
+    def peek(self) -> list:
+        if self.method == 'hifo':
+            return self.lots[0][2]
+        return self.lots[0] if self.method == 'fifo' else self.lots[-1]
+
+    def pop(self):
+        if self.method == 'hifo':
+            heapq.heappop(self.lots)
+        elif self.method == 'fifo':
+            self.lots.popleft()
+        else:
+            self.lots.pop()
+
+    def __len__(self):
+        return len(self.lots)
+
+def realized(txns: list, method: str='fifo') -> list:
+    '''one record per (sale, lot) match: coin, saleDate, buyDate, amount, proceeds, cost, gain, term.
+    sales beyond what was bought get a zero cost basis and an unknown (short term) buy date'''
+    if method not in METHODS:
+        raise ValueError(f'method must be one of {METHODS}')
+    dated = [(_date(x.get('date')), x) for x in txns]
+    # buys before sales on the same day
+    dated = sorted([d for d in dated if d[0] is not None], key=lambda d: (d[0], d[1].get('price') < 0))
+    books = {}
+    out = []
+    for date, x in dated:
+        coin, price, amount = x.get('currency'), x.get('price'), x.get('amount')
+        lots = books.get(coin)
+        if lots is None:
+            lots = books[coin] = Lots(method)
+        if price >= 0:
+            if amount > 0:
+                lots.add(price/amount, date, amount)
+            continue
+        sold, proceeds = -amount, -price
+        left = sold
+        while left > 1e-12:
+            if not len(lots):
+                out.append(_record(coin, date, None, left, proceeds*left/sold, 0))
+                break
+            lot = lots.peek()
+            qty = min(left, lot[2])
+            out.append(_record(coin, date, lot[1], qty, proceeds*qty/sold, qty*lot[0]))
+            lot[2] -= qty
+            left -= qty
+            if lot[2] <= 1e-12:
+                lots.pop()
+    return out
+
+def _record(coin, saleDate, buyDate, amount, proceeds, cost) -> dict:
+    held = (saleDate-buyDate).days if buyDate else None
+    return {'coin':coin, 'saleDate':saleDate.isoformat(), 'buyDate':buyDate.isoformat() if buyDate else None,
+        'amount':amount, 'proceeds':proceeds, 'cost':cost, 'gain':proceeds-cost,
+        'term':'long' if held is not None and held > LONG_TERM else 'short'}
+
+def summary(records: list, year: int=None) -> dict:
+    '''totals (proceeds, cost, short/long gain) overall and per coin, optionally for one sale year'''
+    if year is not None:
+        records = [r for r in records if r.get('saleDate')[:4] == str(year)]
+    total = {'proceeds':0, 'cost':0, 'short':0, 'long':0, 'matches':len(records)}
+    coins = {}
+    for r in records:
+        for t in (total, coins.setdefault(r.get('coin'), {'proceeds':0, 'cost':0, 'short':0, 'long':0})):
+            t['proceeds'] += r.get('proceeds')
+            t['cost'] += r.get('cost')
+            t[r.get('term')] += r.get('gain')
+    return {'total':total, 'coins':coins}
+
+class TaxCache:
+    '''realized() results per user and method, dropped whenever that user writes a txn.
+    holds at most `max_users` users, least recently used out first'''
+    def __init__(self, max_users: int=256):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._gen = {} # bumped on every invalidate so a result computed before a write is never stored
+
+    def get(self, userid: str, method: str):
+        if userid not in self._users:
+            return None
+        self._users.move_to_end(userid)
+        return self._users[userid].get(method)
+
+    def generation(self, userid: str) -> int:
+        return self._gen.get(userid, 0)
+
+    def put(self, userid: str, method: str, records: list, generation: int):
+        if generation != self.generation(userid):
+            return
+        self._users.setdefault(userid, {})[method] = records
+        self._users.move_to_end(userid)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def invalidate(self, userid: str):
+        self._users.pop(userid, None)
+        self._gen[userid] = self.generation(userid)+1
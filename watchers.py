@@ -0,0 +1,137 @@
+'''price alerts. alerts live in mongo; in memory each coin keeps sorted thresholds,
+so after a price refresh each coin is one bisect no matter how many alerts there are'''
+import asyncio
+import datetime as dt
+import heapq
+import logging
+from bisect import bisect_left, bisect_right, insort
+
+log = logging.getLogger(__name__)
+
+MAX_PER_USER = 25
+LAST_ID = 'z' #sorts after any ObjectId hex string, so (price, LAST_ID) is past every entry at that price
+
+class WatchIndex:
+    '''per coin: `above` fires when price >= threshold, `below` when price <= threshold.
+    entries are (threshold, alert id) so equal thresholds stay distinct'''
+    def __init__(self):
+        self.alerts = {}
+        self.coins = {} # coin -> {'above': sorted entries, 'below': sorted entries}
+        self.expiry = [] # heap of (expires, alert id)
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def add(self, alert: dict):
+        aid = str(alert.get('_id'))
+        self.alerts[aid] = alert
+        sides = self.coins.setdefault(alert.get('currency'), {'above':[], 'below':[]})
+        insort(sides[alert.get('op')], (alert.get('price'), aid))
+        if alert.get('expires'):
+            heapq.heappush(self.expiry, (alert.get('expires'), aid))
+
+    def remove(self, aid: str) -> dict:
+        alert = self.alerts.pop(aid, None)
+        if alert is None:
+            return None
+        side = self.coins.get(alert.get('currency')).get(alert.get('op'))
+        entry = (alert.get('price'), aid)
+        i = bisect_left(side, entry)
+        if i < len(side) and side[i] == entry:
+            side.pop(i)
+        return alert
+
+    def triggered(self, coinval: dict) -> list:
+        '''alerts whose threshold the current prices ({coin: {'usd': price}}) have crossed'''
+        hits = []
+        for coin,sides in self.coins.items():
+            price = (coinval.get(coin) or {}).get('usd')
+            if price is None:
+                continue
+            above, below = sides.get('above'), sides.get('below')
+            hits += [self.alerts[aid] for _,aid in above[:bisect_right(above, (price, LAST_ID))]]
+            hits += [self.alerts[aid] for _,aid in below[bisect_left(below, (price, '')):]]
+        return hits
+
+    def expired(self, now) -> list:
+        '''pop alerts past their expiry'''
+        out = []
+        while self.expiry and self.expiry[0][0] <= now:
+            _, aid = heapq.heappop(self.expiry)
+            alert = self.remove(aid)
+            if alert:
+                out.append(alert)
+        return out
+
+class Watchers:
+    '''keeps the WatchIndex in step with the watchers collection and delivers alerts
+    through a bounded queue so a burst of hits can't pile up unbounded DMs'''
+    def __init__(self, store, notify, queue_size: int=1000):
+        self.store = store
+        self.notify = notify # async callable(alert, price)
+        self.index = WatchIndex()
+        self.queue_size = queue_size
+        self.queue = None
+        self.worker = None
+
+    async def load(self):
+        index = WatchIndex()
+        for alert in await self.store.all_watchers():
+            index.add(alert)
+        self.index = index
+        if self.worker is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            self.worker = asyncio.ensure_future(self._deliver())
+        log.info('price alerts loaded', extra={'alerts':len(index), 'coins':len(index.coins)})
+
+    def coins(self) -> list:
+        return [c for c,s in self.index.coins.items() if s.get('above') or s.get('below')]
+
+    async def add(self, userid: str, coin: str, op: str, price: float, life: int=90) -> dict:
+        if op not in ('above', 'below'):
+            raise ValueError('op must be above or below')
+        if await self.store.count_watchers(userid) >= MAX_PER_USER:
+            raise ValueError(f'you can have at most {MAX_PER_USER} alerts')
+        alert = {'userid':userid, 'currency':coin, 'op':op, 'price':float(price),
+            'created':dt.datetime.utcnow(), 'expires':dt.datetime.utcnow()+dt.timedelta(days=life)}
+        await self.store.add_watcher(alert)
+        self.index.add(alert)
+        return alert
+
+    async def remove(self, userid: str, aid: str) -> bool:
+        alert = self.index.alerts.get(aid)
+        if alert is None or alert.get('userid') != userid:
+            return False
+        self.index.remove(aid)
+        await self.store.delete_watchers([aid])
+        return True
+
+    async def remove_user(self, userid: str):
+        for aid in [a for a,x in self.index.alerts.items() if x.get('userid') == userid]:
+            self.index.remove(aid)
+        await self.store.delete_user_watchers(userid)
+
+    async def evaluate(self, coinval: dict):
+        '''run after every price refresh: queue DMs for crossed thresholds, then drop fired and expired alerts'''
+        if self.queue is None:
+            return
+        done = [str(x.get('_id')) for x in self.index.expired(dt.datetime.utcnow())]
+        for alert in self.index.triggered(coinval):
+            try:
+                self.queue.put_nowait((alert, coinval.get(alert.get('currency')).get('usd')))
+            except asyncio.QueueFull:
+                break # the rest stay armed and fire next refresh
+            self.index.remove(str(alert.get('_id')))
+            done.append(str(alert.get('_id')))
+        if done:
+            await self.store.delete_watchers(done)
+
+    async def _deliver(self):
+        while True:
+            alert, price = await self.queue.get()
+            try:
+                await self.notify(alert, price)
+            except Exception as e: # a closed DM shouldn't stop everyone else's alerts
+                log.warning('alert not delivered', extra={'alert':str(alert.get('_id')), 'error':repr(e)})
+            finally:
+                self.queue.task_done()